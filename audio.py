@@ -0,0 +1,109 @@
+"""Voice note preprocessing before Whisper: trim silence, downmix to mono 16 kHz.
+
+Whisper resamples everything to 16 kHz mono internally, so sending exactly that
+(with leading/trailing silence cut off) shrinks the upload without losing
+anything it would have used. Decoding goes through ffmpeg via pydub and runs in
+a small dedicated thread pool so it never blocks the event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+from pydub import AudioSegment
+from pydub.silence import detect_leading_silence
+
+import metrics
+from config import (
+    AUDIO_PREPROCESS, AUDIO_PREPROCESS_WORKERS, VOICE_KEEP_SILENCE_MS, VOICE_SILENCE_DBFS,
+)
+
+logger = logging.getLogger(__name__)
+
+WHISPER_SAMPLE_RATE = 16000
+# Opus is what Telegram voice notes already use; 24 kbps mono is plenty for speech
+_EXPORT_BITRATE = "24k"
+
+_executor = ThreadPoolExecutor(max_workers=AUDIO_PREPROCESS_WORKERS, thread_name_prefix="audio")
+
+_stats = {
+    "notes": 0,
+    "raw_bytes": 0,
+    "sent_bytes": 0,
+    "trimmed_ms": 0,
+    "silent": 0,
+    "failures": 0,
+}
+
+
+def get_audio_stats() -> dict[str, int]:
+    """Counters of the preprocessing stage: volume in/out, silence cut, failures."""
+    return dict(_stats)
+
+
+metrics.Counter("tutor_voice_bytes_total", "Voice note bytes downloaded vs sent to Whisper.", ("kind",),
+                fn=lambda: {("raw",): _stats["raw_bytes"], ("sent",): _stats["sent_bytes"]})
+metrics.Counter("tutor_voice_trimmed_seconds_total", "Leading/trailing silence cut from voice notes.",
+                fn=lambda: {(): _stats["trimmed_ms"] / 1000})
+
+
+def _preprocess(data: bytes) -> tuple[bytes, int]:
+    """Decode, trim and re-encode one voice note; returns (ogg bytes, ms trimmed).
+
+    Returns empty bytes when the whole note is below the silence threshold.
+    """
+    segment = AudioSegment.from_file(io.BytesIO(data))
+    start = detect_leading_silence(segment, silence_threshold=VOICE_SILENCE_DBFS)
+    if start >= len(segment):
+        return b"", len(segment)
+    end = len(segment) - detect_leading_silence(segment.reverse(), silence_threshold=VOICE_SILENCE_DBFS)
+    start = max(0, start - VOICE_KEEP_SILENCE_MS)
+    end = min(len(segment), end + VOICE_KEEP_SILENCE_MS)
+
+    trimmed = segment[start:end].set_channels(1).set_frame_rate(WHISPER_SAMPLE_RATE)
+    out = io.BytesIO()
+    trimmed.export(out, format="ogg", codec="libopus", bitrate=_EXPORT_BITRATE)
+    return out.getvalue(), len(segment) - len(trimmed)
+
+
+async def preprocess_voice(audio: BinaryIO) -> tuple[BinaryIO | None, bool]:
+    """Prepare a downloaded voice note for Whisper.
+
+    Returns (buffer to upload, whether it was preprocessed). The buffer is None
+    when the note is pure silence. If preprocessing is disabled, fails, or would
+    not make the upload smaller, the original audio is returned unchanged.
+    """
+    # Only the size unless preprocessing runs: a note spooled to disk stays there
+    audio.seek(0, io.SEEK_END)
+    size = audio.tell()
+    audio.seek(0)
+    _stats["notes"] += 1
+    _stats["raw_bytes"] += size
+
+    if AUDIO_PREPROCESS:
+        raw = audio.read()
+        audio.seek(0)
+        try:
+            with metrics.span("audio_preprocess"):
+                processed, trimmed_ms = await asyncio.get_running_loop().run_in_executor(
+                    _executor, _preprocess, raw,
+                )
+        except Exception:
+            _stats["failures"] += 1
+            logger.warning("Voice preprocessing failed, sending original audio", exc_info=True)
+        else:
+            _stats["trimmed_ms"] += trimmed_ms
+            if not processed:
+                _stats["silent"] += 1
+                return None, True
+            if len(processed) < size:
+                _stats["sent_bytes"] += len(processed)
+                logger.info("Voice preprocessed: %d -> %d bytes, %d ms of silence cut",
+                            size, len(processed), trimmed_ms)
+                return io.BytesIO(processed), True
+
+    _stats["sent_bytes"] += size
+    return audio, False
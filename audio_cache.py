@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def audio_key(*parts: str) -> str:
+    """Content address for a piece of audio: sha256 over the parts that determine it."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Two-tier LRU cache of synthesized audio, each tier bounded by total bytes.
+
+    The memory tier holds the hottest clips; the disk tier (one file per key in
+    `directory`) survives restarts. A disk hit is promoted back into memory.
+    Pass directory=None to run memory-only.
+    """
+
+    def __init__(self, directory: str | Path | None, memory_bytes: int, disk_bytes: int) -> None:
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_size = 0
+        self._dir = Path(directory) if directory else None
+        if self._dir is not None:
+            self._load_disk_index()
+
+    def _load_disk_index(self) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        # Left behind by a write that never finished
+        for partial in self._dir.glob("*.tmp"):
+            partial.unlink(missing_ok=True)
+        files = sorted(self._dir.glob("*.mp3"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._disk[path.stem] = size
+            self._disk_size += size
+        self._evict_disk()
+        logger.info("TTS cache: %d files (%d bytes) on disk", len(self._disk), self._disk_size)
+
+    def _path(self, key: str) -> Path:
+        return self._dir / f"{key}.mp3"
+
+    def _write_file(self, key: str, data: bytes) -> None:
+        """Write via a temp file and rename, so no reader (or other process) sees a partial file."""
+        fd, tmp = tempfile.mkstemp(dir=self._dir, prefix=f"{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def get(self, key: str) -> bytes | None:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+
+        if key in self._disk:
+            try:
+                data = await asyncio.to_thread(self._path(key).read_bytes)
+            except OSError:
+                logger.warning("TTS cache file vanished: %s", key)
+                self._disk_size -= self._disk.pop(key)
+            else:
+                self._disk.move_to_end(key)
+                self.disk_hits += 1
+                self._put_memory(key, data)
+                return data
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes) -> None:
+        self._put_memory(key, data)
+        if self._dir is None or key in self._disk or len(data) > self.disk_bytes:
+            return
+        try:
+            await asyncio.to_thread(self._write_file, key, data)
+        except OSError:
+            logger.exception("Failed to write TTS cache file")
+            return
+        if key in self._disk:
+            # A concurrent put of the same key finished first; the file was just replaced in place
+            return
+        self._disk[key] = len(data)
+        self._disk_size += len(data)
+        self._evict_disk()
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict_disk(self) -> None:
+        while self._disk_size > self.disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size,
+        }
@@ -0,0 +1,115 @@
+"""Benchmark: legacy per-request prompt formatting vs the precompiled prompt table.
+
+Reports per-call build cost and how much of each prompt is a prefix shared with
+other variants (what provider-side prompt caching can reuse across users).
+
+    python bench/bench_prompts.py
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import (  # noqa: E402
+    DIALECT_EKAVICA, DIALECT_IJEKAVICA, SCRIPT_CYRILLIC, SCRIPT_LATIN,
+    STYLE_BEGINNER, STYLE_CASUAL, STYLE_EVERYDAY, STYLE_FORMAL,
+    DIALECTS, EXPLANATION_LANGUAGES, SCRIPTS, STYLES, get_system_prompt,
+)
+
+# Layout used before the prompt table existed, kept verbatim for comparison
+LEGACY_TEMPLATE = """You are a patient and encouraging Serbian language tutor.
+
+The student is learning Serbian and has chosen the **{dialect_name}** dialect.
+The student wants you to write in **{script_name}** script.
+
+{dialect_instructions}
+
+{script_instructions}
+
+The student's native language is **{explanation_language}**. ALL explanations, translations, and corrections MUST be written in {explanation_language}. NEVER mix languages in explanations.
+
+Rules:
+- Your main conversational response: ALWAYS in Serbian (chosen dialect and script).
+- Keep your responses conversational and natural — as if you are chatting with a friend who is learning the language.
+- Encourage the student and praise their effort.
+- If you provide translations or explanations inline, put them in parentheses in {explanation_language}.
+- After your main response in Serbian, add a section called "---\\n📝 {corrections_header}" (Corrections).
+  In this section, explain any grammar, vocabulary, or pronunciation mistakes the student made.
+  Write ALL corrections and explanations ONLY in {explanation_language}. Do NOT use any other language for explanations.
+  ALL Serbian words quoted in the corrections section MUST use the chosen script ({script_name}). Never quote Serbian words in a different script.
+  If there are no mistakes, write "{no_mistakes_text}"
+- If the transcribed text seems garbled or nonsensical (Whisper errors), try to guess what the student meant and respond accordingly, noting what you think they meant.
+"""
+
+
+def legacy_build_system_prompt(dialect: str, script: str = "cyrillic", ui_language: str = "ru", style: str = "casual") -> str:
+    dialect_name = "Ijekavica (Montenegrin)" if dialect == "ijekavica" else "Ekavica (Standard Serbian)"
+    dialect_instr = DIALECT_IJEKAVICA if dialect == "ijekavica" else DIALECT_EKAVICA
+    script_name = "Latin (Latinica)" if script == "latin" else "Cyrillic (Ћирилица)"
+    script_instr = SCRIPT_LATIN if script == "latin" else SCRIPT_CYRILLIC
+    explanation_lang = {"ru": "Russian", "en": "English", "de": "German"}.get(ui_language, "English")
+
+    style_map = {"formal": STYLE_FORMAL, "everyday": STYLE_EVERYDAY, "casual": STYLE_CASUAL, "beginner": STYLE_BEGINNER}
+    style_instr = style_map.get(style, STYLE_EVERYDAY)
+
+    if script == "latin":
+        corrections_header = "Ispravke"
+        no_mistakes_text = "Odlično! Nema grešaka. / Отлично! Ошибок нет."
+    else:
+        corrections_header = "Исправке"
+        no_mistakes_text = "Одлично! Нема грешака. / Отлично! Ошибок нет."
+
+    return LEGACY_TEMPLATE.format(
+        dialect_name=dialect_name,
+        dialect_instructions=dialect_instr,
+        script_name=script_name,
+        script_instructions=script_instr,
+        explanation_language=explanation_lang,
+        corrections_header=corrections_header,
+        no_mistakes_text=no_mistakes_text,
+    ) + "\n" + style_instr
+
+
+def _common_prefix(a: str, b: str) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def _prefix_stats(prompts: list[str]) -> tuple[int, float, float]:
+    """(prefix shared by all, mean pairwise shared prefix, mean prompt length) in chars."""
+    common = min(_common_prefix(prompts[0], p) for p in prompts)
+    pairs = list(itertools.combinations(prompts, 2))
+    mean_pair = sum(_common_prefix(a, b) for a, b in pairs) / len(pairs)
+    mean_len = sum(len(p) for p in prompts) / len(prompts)
+    return common, mean_pair, mean_len
+
+
+def main() -> None:
+    keys = list(itertools.product(DIALECTS, SCRIPTS, EXPLANATION_LANGUAGES, STYLES))
+    legacy = [legacy_build_system_prompt(d, s, lang, st) for d, s, lang, st in keys]
+    table = [get_system_prompt(d, s, lang, st).text for d, s, lang, st in keys]
+
+    n = 20000
+    t_legacy = timeit.timeit(lambda: legacy_build_system_prompt("ijekavica", "latin", "de", "casual"), number=n)
+    t_table = timeit.timeit(lambda: get_system_prompt("ijekavica", "latin", "de", "casual"), number=n)
+    print(f"{len(keys)} variants")
+    print(f"build per call:  legacy {t_legacy / n * 1e6:8.2f} us   table {t_table / n * 1e6:8.2f} us   "
+          f"({t_legacy / t_table:.0f}x)")
+
+    for name, prompts in (("legacy", legacy), ("table", table)):
+        common, mean_pair, mean_len = _prefix_stats(prompts)
+        print(f"{name:>7}: shared by all {common:5d} chars (~{common // 4} tok), "
+              f"mean pairwise {mean_pair:7.0f} chars, "
+              f"{mean_pair / mean_len:5.1%} of a {mean_len:.0f}-char prompt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Throughput of supervisor mode at different worker counts.
+
+Runs `bot.py` in webhook mode as a subprocess against the fake OpenAI and
+Telegram servers (with no added latency, so the bot's own CPU work is the
+bottleneck), posts a burst of text updates from many users and measures how
+long the workers take to finish them, read from each worker's /metrics.
+
+    python bench/bench_sharding.py                      # WORKERS=1,2,4,... up to the core count
+    python bench/bench_sharding.py --workers 1 2 4 8 --updates 2000
+
+Speedup is only meaningful when the machine has at least as many free cores
+as workers (plus one for the fake servers and the supervisor).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import fake_openai  # noqa: E402
+import fake_telegram  # noqa: E402
+from e2e import FAKE_TOKEN, _start  # noqa: E402
+from fake_openai import Latency  # noqa: E402
+
+SECRET = "bench-secret"
+WORKER_STOP_WAIT = 60
+_HANDLED = re.compile(r'^tutor_stage_duration_seconds_count\{stage="handler\.handle_text",[^}]*\} (\S+)$', re.M)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _handled(session: aiohttp.ClientSession, ports: list[int]) -> int:
+    total = 0
+    for port in ports:
+        try:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                total += sum(int(float(v)) for v in _HANDLED.findall(await resp.text()))
+        except aiohttp.ClientError:
+            pass
+    return total
+
+
+async def _wait_ready(session: aiohttp.ClientSession, ports: list[int], timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    pending = list(ports)
+    while pending:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"bot did not come up, still waiting for ports {pending}")
+        try:
+            async with session.get(f"http://127.0.0.1:{pending[0]}/healthz") as resp:
+                if resp.status == 200:
+                    pending.pop(0)
+                    continue
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+
+
+async def run_one(workers: int, args: argparse.Namespace, env: dict[str, str]) -> dict:
+    webhook_port, metrics_port = _free_port(), _free_port()
+    # Single-process mode serves handler metrics on the webhook port itself
+    worker_ports = [metrics_port + 1 + i for i in range(workers)] if workers > 1 else [webhook_port]
+    env = {**env, "WORKERS": str(workers), "PORT": str(webhook_port), "METRICS_PORT": str(metrics_port)}
+    proc = subprocess.Popen([sys.executable, str(ROOT / "bot.py")], cwd=ROOT, env=env)
+    try:
+        async with aiohttp.ClientSession() as session:
+            await _wait_ready(session, [webhook_port, *worker_ports])
+            updates = [
+                fake_telegram.text_update(50_000 + i % args.users, "Zdravo") for i in range(args.updates)
+            ]
+            url = f"http://127.0.0.1:{webhook_port}/telegram/webhook"
+            started = time.perf_counter()
+            statuses = await fake_telegram.post_updates(url, SECRET, updates)
+            while (done := await _handled(session, worker_ports)) < len(updates):
+                if time.perf_counter() - started > args.timeout:
+                    raise RuntimeError(f"only {done}/{len(updates)} updates handled in {args.timeout}s")
+                await asyncio.sleep(0.1)
+            wall = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait(timeout=WORKER_STOP_WAIT)
+    return {
+        "workers": workers,
+        "updates": len(updates),
+        "rejected": sum(status != 200 for status in statuses),
+        "wall_seconds": round(wall, 3),
+        "updates_per_second": round(len(updates) / wall, 1),
+    }
+
+
+async def _prepare_db(path: str, env: dict[str, str], users: int) -> None:
+    """Onboarded users, so every update goes all the way through the LLM and TTS."""
+    os.environ.update({**env, "DATABASE_URL": f"sqlite+aiosqlite:///{path}"})
+    sys.path.insert(0, str(ROOT))
+    from database import engine, init_db, upsert_user
+
+    await init_db()
+    for i in range(users):
+        await upsert_user(50_000 + i, {"dialect": "ekavica", "script": "latin", "style": "everyday"})
+    await engine.dispose()
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    zero = Latency(0, 0)
+    openai_runner, openai_url = await _start(fake_openai.create_app(fake_openai.FakeOpenAIConfig(
+        stt=zero, chat_first_token=zero, chat_token_interval=zero, tts=zero,
+    )))
+    telegram_runner, telegram_url = await _start(fake_telegram.create_app(zero))
+    workdir = tempfile.mkdtemp(prefix="tutor-shard-bench-")
+    env = {
+        **os.environ,
+        "BOT_TOKEN": FAKE_TOKEN,
+        "LLM_API_KEY": "fake",
+        "OPENAI_API_KEY": "fake",
+        "LLM_BASE_URL": f"{openai_url}/v1",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "LLM_FALLBACK_MODEL": "",
+        "TELEGRAM_API_URL": telegram_url,
+        "BOT_MODE": "webhook",
+        "WEBHOOK_BASE_URL": "https://bench.invalid",
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_HOST": "127.0.0.1",
+        "TTS_CACHE_DIR": "",
+        "LOG_LEVEL": "WARNING",
+        # Measure the bot, not the limits that protect the real APIs
+        "TELEGRAM_GLOBAL_RATE": "1000000",
+        "TELEGRAM_CHAT_BURST": "1000000",
+        "CHAT_CONCURRENCY": "1000",
+        "TTS_CONCURRENCY": "1000",
+        "STREAM_EDIT_INTERVAL": "60",
+    }
+    template = f"{workdir}/template.db"
+    await _prepare_db(template, env, args.users)
+    results = []
+    try:
+        for workers in args.workers:
+            # A fresh copy each time, so every run starts from the same conversation history
+            shutil.copy(template, f"{workdir}/bench-{workers}.db")
+            env["DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir}/bench-{workers}.db"
+            result = await run_one(workers, args, env)
+            results.append(result)
+            print(f"WORKERS={workers:<3} {result['updates_per_second']:>8} updates/s "
+                  f"({result['updates']} in {result['wall_seconds']}s)", flush=True)
+    finally:
+        await openai_runner.cleanup()
+        await telegram_runner.cleanup()
+    base = results[0]["updates_per_second"] if results else 0
+    for result in results:
+        result["speedup"] = round(result["updates_per_second"] / base, 2) if base else None
+    return results
+
+
+def main() -> None:
+    cores = os.cpu_count() or 1
+    default_workers = [n for n in (1, 2, 4, 8, 16) if n <= max(1, cores - 1)] or [1]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", type=Path, default=Path("bench_sharding.json"))
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    args.output.write_text(json.dumps({"cores": cores, "runs": results}, indent=2))
+    print(f"{cores} cores -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""End-to-end latency benchmark for handle_voice / handle_text.
+
+Starts the fake OpenAI and Telegram servers from this directory on local ports,
+points llm_client, audio_client and the aiogram Bot at them, replays an update
+trace through the real Dispatcher and reports p50/p95/p99 per handler.
+
+    python bench/e2e.py                              # synthetic trace
+    python bench/e2e.py --write-trace t.jsonl        # save the synthetic trace
+    python bench/e2e.py --trace t.jsonl --output bench_results.json
+
+A trace is JSON lines of {"at": <seconds from start>, "update": <Telegram Update>}.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import fake_openai  # noqa: E402
+import fake_telegram  # noqa: E402
+from fake_openai import Latency  # noqa: E402
+
+FAKE_TOKEN = "123456:FAKE-benchmark-token"
+
+
+def synthetic_trace(users: int, messages: int, rate: float, voice_share: float, seed: int) -> list[dict]:
+    """Poisson arrivals at `rate` updates/s, spread over `users` users."""
+    rng = random.Random(seed)
+    trace, at = [], 0.0
+    for _ in range(messages):
+        at += rng.expovariate(rate)
+        user_id = 10_000 + rng.randrange(users)
+        if rng.random() < voice_share:
+            update = fake_telegram.voice_update(user_id, duration=rng.randint(2, 15))
+        else:
+            update = fake_telegram.text_update(user_id, rng.choice(["Zdravo", "Kako si?", "Dobar dan", "Hvala!"]))
+        trace.append({"at": round(at, 4), "update": update})
+    return trace
+
+
+def load_trace(path: Path) -> list[dict]:
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def _start(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(args: argparse.Namespace, trace: list[dict]) -> dict:
+    openai_app = fake_openai.create_app(fake_openai.FakeOpenAIConfig(
+        stt=Latency(args.stt),
+        chat_first_token=Latency(args.llm_ttft),
+        chat_token_interval=Latency(args.llm_token_interval, 0),
+        tts=Latency(args.tts),
+    ))
+    telegram_app = fake_telegram.create_app(Latency(args.telegram))
+    openai_runner, openai_url = await _start(openai_app)
+    fallback_app = fallback_runner = None
+    if args.fallback_llm_ttft > 0:
+        fallback_app = fake_openai.create_app(fake_openai.FakeOpenAIConfig(
+            chat_first_token=Latency(args.fallback_llm_ttft),
+            chat_token_interval=Latency(args.llm_token_interval, 0),
+        ))
+        fallback_runner, fallback_url = await _start(fallback_app)
+    telegram_runner, telegram_url = await _start(telegram_app)
+
+    # Must be in place before config.py is imported by the bot modules
+    workdir = tempfile.mkdtemp(prefix="tutor-bench-")
+    os.environ.update({
+        "BOT_TOKEN": FAKE_TOKEN,
+        "LLM_API_KEY": "fake",
+        "OPENAI_API_KEY": "fake",
+        "LLM_BASE_URL": f"{openai_url}/v1",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "TELEGRAM_API_URL": telegram_url,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/bench.db",
+        "TTS_CACHE_DIR": "" if args.no_tts_cache else f"{workdir}/tts_cache",
+        # FAKE_VOICE is not decodable audio
+        "AUDIO_PREPROCESS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    if fallback_app is not None:
+        os.environ["LLM_FALLBACK_BASE_URL"] = f"{fallback_url}/v1"
+        os.environ["LLM_FALLBACK_MODEL"] = os.environ.get("CHAT_MODEL", "gpt-4o")
+    else:
+        os.environ["LLM_FALLBACK_MODEL"] = ""
+
+    from aiogram import BaseMiddleware, Bot, Dispatcher
+    from aiogram.client.default import DefaultBotProperties
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.enums import ParseMode
+
+    from config import setup_logging
+    from database import init_db, start_usage_writer, stop_usage_writer, upsert_user
+    from handlers import router
+    from sender import flood_control, get_upload_stats
+
+    setup_logging()
+    await init_db()
+    start_usage_writer()
+
+    samples: dict[str, list[float]] = {}
+    errors = [0]
+
+    class Timing(BaseMiddleware):
+        async def __call__(self, handler, event, data):
+            name = data["handler"].callback.__name__
+            start = time.perf_counter()
+            try:
+                return await handler(event, data)
+            except Exception:
+                errors[0] += 1
+                raise
+            finally:
+                samples.setdefault(name, []).append(time.perf_counter() - start)
+
+    router.message.middleware(Timing())
+    bot = Bot(
+        token=FAKE_TOKEN,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+    bot.session.middleware(flood_control)
+    dp = Dispatcher()
+    dp.include_router(router)
+
+    user_ids = {entry["update"]["message"]["from"]["id"] for entry in trace}
+    for user_id in user_ids:
+        await upsert_user(user_id, {"dialect": "ekavica", "script": "latin", "style": "everyday"})
+
+    started = time.perf_counter()
+
+    async def _feed(entry: dict) -> None:
+        delay = entry["at"] / args.speed - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await dp.feed_raw_update(bot, entry["update"])
+
+    await asyncio.gather(*(_feed(entry) for entry in trace))
+    wall = time.perf_counter() - started
+
+    await stop_usage_writer()
+    await bot.session.close()
+    await openai_runner.cleanup()
+    if fallback_runner is not None:
+        await fallback_runner.cleanup()
+    await telegram_runner.cleanup()
+
+    return {
+        "updates": len(trace),
+        "users": len(user_ids),
+        "wall_seconds": round(wall, 3),
+        "errors": errors[0],
+        "fake_latency": {
+            "stt": args.stt, "llm_ttft": args.llm_ttft, "llm_token_interval": args.llm_token_interval,
+            "fallback_llm_ttft": args.fallback_llm_ttft,
+            "tts": args.tts, "telegram": args.telegram,
+        },
+        "provider_calls": openai_app["counters"],
+        "fallback_chat_calls": fallback_app["counters"]["chat"] if fallback_app else 0,
+        "telegram_calls": telegram_app["calls"],
+        "telegram_uploaded_bytes": telegram_app["uploaded_bytes"][0],
+        "document_uploads": get_upload_stats(),
+        "handlers": {
+            name: {
+                "count": len(values),
+                "p50": round(percentile(values, 50), 4),
+                "p95": round(percentile(values, 95), 4),
+                "p99": round(percentile(values, 99), 4),
+                "max": round(max(values), 4),
+            }
+            for name, values in sorted(samples.items())
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", type=Path, help="JSONL trace to replay (default: synthetic)")
+    parser.add_argument("--write-trace", type=Path, help="write the synthetic trace here and exit")
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=10.0, help="synthetic arrivals per second")
+    parser.add_argument("--voice-share", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("--stt", type=float, default=0.6, help="median Whisper latency, s")
+    parser.add_argument("--llm-ttft", type=float, default=0.5, help="median time to first token, s")
+    parser.add_argument("--llm-token-interval", type=float, default=0.02, help="s between streamed words")
+    parser.add_argument("--fallback-llm-ttft", type=float, default=0.0,
+                        help="median time to first token of a hedge route, s (0 = no hedging)")
+    parser.add_argument("--tts", type=float, default=0.4, help="median TTS latency, s")
+    parser.add_argument("--telegram", type=float, default=0.05, help="median Bot API latency, s")
+    parser.add_argument("--no-tts-cache", action="store_true")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.users, args.messages, args.rate, args.voice_share, args.seed)
+    if args.write_trace:
+        with args.write_trace.open("w") as f:
+            for entry in trace:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"wrote {len(trace)} updates to {args.write_trace}")
+        return
+
+    result = asyncio.run(run(args, trace))
+    args.output.write_text(json.dumps(result, indent=2))
+    for name, stats in result["handlers"].items():
+        print(f"{name:<14} n={stats['count']:<5} p50={stats['p50']:.3f}s  p95={stats['p95']:.3f}s  "
+              f"p99={stats['p99']:.3f}s")
+    print(f"{result['updates']} updates in {result['wall_seconds']}s, {result['errors']} errors "
+          f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Local stand-in for the OpenAI-compatible endpoints the bot calls.
+
+Serves /v1/audio/transcriptions, /v1/chat/completions (plain and streamed) and
+/v1/audio/speech with configurable latency, so handlers can be measured without
+paying for real API calls.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+TUTOR_REPLY = (
+    "Zdravo! Baš mi je drago što vežbaš srpski. Kako si provela vikend? "
+    "Ja sam bila na Kalemegdanu i gledala zalazak sunca. Hajde, ispričaj mi nešto o sebi!\n"
+    "---\n📝 Ispravke\nOdlično! Nema grešaka. / Отлично! Ошибок нет."
+)
+TRANSCRIPTION = "Zdravo, kako si? Ja sam dobro, hvala."
+
+
+@dataclass
+class Latency:
+    """Log-normal latency around `median` seconds; sigma 0 makes it fixed."""
+
+    median: float
+    sigma: float = 0.3
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * random.lognormvariate(0, self.sigma) if self.sigma else self.median
+
+
+@dataclass
+class FakeOpenAIConfig:
+    stt: Latency = field(default_factory=lambda: Latency(0.6))
+    chat_first_token: Latency = field(default_factory=lambda: Latency(0.5))
+    chat_token_interval: Latency = field(default_factory=lambda: Latency(0.02, 0))
+    tts: Latency = field(default_factory=lambda: Latency(0.4))
+    reply: str = TUTOR_REPLY
+    transcription: str = TRANSCRIPTION
+
+
+def _chunk(model: str, delta: dict | None, finish_reason: str | None = None, usage: dict | None = None) -> bytes:
+    payload = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+def _usage(messages: list[dict], reply: str) -> dict:
+    """Rough token counts (~4 chars per token), enough to exercise usage reporting."""
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4
+    completion = len(reply) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def create_app(config: FakeOpenAIConfig | None = None) -> web.Application:
+    config = config or FakeOpenAIConfig()
+    counters: dict[str, int] = {"transcriptions": 0, "chat": 0, "speech": 0}
+
+    async def transcriptions(request: web.Request) -> web.Response:
+        await request.read()
+        counters["transcriptions"] += 1
+        await asyncio.sleep(config.stt.sample())
+        return web.json_response({"text": config.transcription})
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        counters["chat"] += 1
+        model = body.get("model", "fake")
+        await asyncio.sleep(config.chat_first_token.sample())
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": config.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": _usage(body.get("messages", []), config.reply),
+            })
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        await resp.write(_chunk(model, {"role": "assistant", "content": ""}))
+        words = config.reply.split(" ")
+        for i, word in enumerate(words):
+            await resp.write(_chunk(model, {"content": word if i == 0 else " " + word}))
+            await asyncio.sleep(config.chat_token_interval.sample())
+        await resp.write(_chunk(model, {}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await resp.write(_chunk(model, None, usage=_usage(body.get("messages", []), config.reply)))
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def speech(request: web.Request) -> web.Response:
+        body = await request.json()
+        counters["speech"] += 1
+        await asyncio.sleep(config.tts.sample())
+        # Roughly the size of real 24 kbps speech for this much text
+        return web.Response(body=b"\xff\xfb" * (len(body.get("input", "")) * 60), content_type="audio/mpeg")
+
+    app = web.Application()
+    app["counters"] = counters
+    app.router.add_post("/v1/audio/transcriptions", transcriptions)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/audio/speech", speech)
+    return app
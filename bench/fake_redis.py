@@ -0,0 +1,144 @@
+"""Local stand-in for a Redis server, enough for RedisStateStore.
+
+Speaks RESP2 and supports PING, AUTH, SELECT, GET, MGET, SET (with EX/PX),
+DEL and FLUSHDB, with key expiry. Point REDIS_URL at it to run the bot (or the
+state store check below) without a real Redis.
+
+    python bench/fake_redis.py --port 6390
+    python bench/fake_redis.py --check          # round-trips through RedisStateStore
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+
+def _bulk(value: str | None) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedis:
+    def __init__(self, password: str | None = None) -> None:
+        self.password = password
+        self.data: dict[str, tuple[str, float | None]] = {}
+        self.commands: dict[str, int] = {}
+
+    def _get(self, key: str) -> str | None:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: list[str], session: dict) -> bytes:
+        name = args[0].upper()
+        self.commands[name] = self.commands.get(name, 0) + 1
+        if name == "AUTH":
+            session["authed"] = args[-1] == self.password
+            return b"+OK\r\n" if session["authed"] else b"-WRONGPASS invalid password\r\n"
+        if self.password and not session.get("authed"):
+            return b"-NOAUTH Authentication required.\r\n"
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "SELECT":
+            return b"+OK\r\n"
+        if name == "GET":
+            return _bulk(self._get(args[1]))
+        if name == "MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(_bulk(self._get(key)) for key in args[1:])
+        if name == "SET":
+            expires_at = None
+            options = [arg.upper() for arg in args[3:]]
+            if "PX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index("PX") + 1]) / 1000
+            elif "EX" in options:
+                expires_at = time.monotonic() + int(args[3 + options.index("EX") + 1])
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if name == "DEL":
+            removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+            return b":%d\r\n" % removed
+        if name == "FLUSHDB":
+            self.data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session: dict = {}
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n")
+                if not header.startswith(b"*"):
+                    writer.write(b"-ERR inline commands are not supported\r\n")
+                    break
+                args = []
+                for _ in range(int(header[1:-2])):
+                    length = int((await reader.readuntil(b"\r\n"))[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode())
+                writer.write(self.execute(args, session))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start(host: str = "127.0.0.1", port: int = 0, password: str | None = None):
+    """Start a FakeRedis server; returns (fake, server, port)."""
+    fake = FakeRedis(password)
+    server = await asyncio.start_server(fake.handle, host, port)
+    return fake, server, server.sockets[0].getsockname()[1]
+
+
+async def _check() -> None:
+    fake, server, port = await start(password="secret")
+    os.environ.setdefault("BOT_TOKEN", "check")
+    os.environ.setdefault("LLM_API_KEY", "check")
+    os.environ.setdefault("OPENAI_API_KEY", "check")
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from state_store import RedisStateStore
+
+    store = RedisStateStore(f"redis://:secret@127.0.0.1:{port}/1")
+    await store.set("a", "1")
+    await store.set("b", "2", ttl=0.05)
+    assert await store.get_many(["a", "b", "c"]) == {"a": "1", "b": "2"}
+    await asyncio.sleep(0.1)
+    assert await store.get_many(["a", "b"]) == {"a": "1"}
+    await store.delete("a")
+    assert await store.get("a") is None
+    await store.close()
+    server.close()
+    await server.wait_closed()
+    print(f"RedisStateStore OK, commands: {fake.commands}")
+
+
+async def _serve(host: str, port: int, password: str | None) -> None:
+    _, server, port = await start(host, port, password)
+    print(f"fake redis listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password")
+    parser.add_argument("--check", action="store_true", help="self-test RedisStateStore and exit")
+    args = parser.parse_args()
+    asyncio.run(_check() if args.check else _serve(args.host, args.port, args.password))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Local stand-ins for Telegram.
+
+- `post_updates` plays Telegram's side of the webhook: it posts fake updates to the bot.
+- `create_app` is a fake Bot API server (sendMessage, editMessageText, sendDocument,
+  getFile, file downloads, ...) with configurable latency, for the benchmarks.
+
+Usage (bot running with BOT_MODE=webhook):
+    python bench/fake_telegram.py --url http://localhost:8080/telegram/webhook \
+        --secret $WEBHOOK_SECRET --text "Zdravo" --count 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+from aiohttp import web
+
+from fake_openai import Latency
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1_000_000)
+
+# A few hundred bytes standing in for a short OGG/Opus voice note
+FAKE_VOICE = b"OggS" + b"\x00" * 2000
+
+
+def _message(user_id: int, **content) -> dict:
+    return {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test", "language_code": "ru"},
+        **content,
+    }
+
+
+def text_update(user_id: int, text: str) -> dict:
+    """Minimal Update payload for a private text message from `user_id`."""
+    return {"update_id": next(_update_ids), "message": _message(user_id, text=text)}
+
+
+def voice_update(user_id: int, duration: int = 4, file_unique_id: str | None = None) -> dict:
+    """Minimal Update payload for a private voice message from `user_id`."""
+    update_id = next(_update_ids)
+    unique = file_unique_id or f"voice-{update_id}"
+    return {
+        "update_id": update_id,
+        "message": _message(user_id, voice={
+            "file_id": f"file-{unique}",
+            "file_unique_id": unique,
+            "duration": duration,
+            "mime_type": "audio/ogg",
+            "file_size": len(FAKE_VOICE),
+        }),
+    }
+
+
+async def post_updates(url: str, secret: str, updates: list[dict]) -> list[int]:
+    """POST each update the way Telegram does and return the HTTP status codes."""
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    async with aiohttp.ClientSession() as session:
+        async def _post(update: dict) -> int:
+            async with session.post(url, json=update, headers=headers) as resp:
+                return resp.status
+        return await asyncio.gather(*(_post(u) for u in updates))
+
+
+def create_app(latency: Latency | None = None) -> web.Application:
+    """Fake Bot API. Mount at the root and point TelegramAPIServer.from_base() at it."""
+    latency = latency or Latency(0.05)
+    calls: dict[str, int] = {}
+    uploaded_bytes = [0]
+
+    async def method(request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        calls[name] = calls.get(name, 0) + 1
+        if request.content_type.startswith("multipart/"):
+            params = {}
+            async for part in await request.multipart():
+                data = await part.read()
+                if part.filename:
+                    uploaded_bytes[0] += len(data)
+                    params[part.name] = {"filename": part.filename, "size": len(data)}
+                else:
+                    params[part.name] = data.decode()
+        else:
+            params = dict(await request.post()) if request.can_read_body else {}
+        await asyncio.sleep(latency.sample())
+
+        chat_id = int(params.get("chat_id", 0) or 0)
+        lower = name.lower()
+        if lower == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        elif lower == "getfile":
+            file_id = params.get("file_id", "file")
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id.removeprefix("file-"),
+                "file_size": len(FAKE_VOICE),
+                "file_path": f"voice/{file_id}.oga",
+            }
+        elif lower in ("sendmessage", "editmessagetext"):
+            result = _message(chat_id, text=params.get("text", ""))
+            if lower == "editmessagetext" and params.get("message_id"):
+                result["message_id"] = int(params["message_id"])
+        elif lower == "senddocument":
+            doc = params.get("document")
+            file_id = doc if isinstance(doc, str) else f"doc-{next(_message_ids)}"
+            result = _message(chat_id, document={
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_name": "srpski_tutor.mp3",
+            })
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency.sample())
+        return web.Response(body=FAKE_VOICE, content_type="audio/ogg")
+
+    app = web.Application(client_max_size=50 * 1024 * 1024)
+    app["calls"] = calls
+    app["uploaded_bytes"] = uploaded_bytes
+    app.router.add_post("/bot{token}/{method}", method)
+    app.router.add_get("/file/bot{token}/{path:.*}", download)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8080/telegram/webhook")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--text", default="Zdravo")
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--count", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = [text_update(args.user_id, args.text) for _ in range(args.count)]
+    statuses = asyncio.run(post_updates(args.url, args.secret, updates))
+    print(f"posted {len(statuses)} updates, statuses: {sorted(set(statuses))}")
+
+
+if __name__ == "__main__":
+    main()
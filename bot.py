@@ -1,15 +1,30 @@
 import asyncio
 import logging
+import secrets
 import signal
+from multiprocessing.queues import Queue
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommand
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from config import BOT_TOKEN, setup_logging
-from database import init_db
+from config import (
+    BOT_MODE, BOT_TOKEN, DB_URL, METRICS_PORT, TELEGRAM_API_URL, WEBHOOK_BASE_URL, WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_PORT,
+    WEBHOOK_SECRET, WORKER_SHUTDOWN_TIMEOUT, WORKERS, setup_logging,
+)
+from database import (
+    init_db, start_stats_compactor, start_usage_writer, stop_stats_compactor, stop_usage_writer,
+)
 from handlers import router
+from metrics import metrics_handler
+from sender import flood_control
+from sharding import Supervisor, consume, poll_updates
+from state_store import StateStoreStorage, create_state_store
 
 logger = logging.getLogger(__name__)
 
@@ -17,23 +32,113 @@ logger = logging.getLogger(__name__)
 _shutdown_event: asyncio.Event | None = None
 
 
-async def main() -> None:
-    global _shutdown_event
-    setup_logging()
-    logger.info("Starting Serbian Tutor Bot...")
+async def _register_commands(bot: Bot) -> None:
+    """Register bot commands so they appear in Telegram's menu."""
+    await bot.set_my_commands([
+        BotCommand(command="start", description="Start over / Начать сначала"),
+        BotCommand(command="settings", description="Settings / Настройки"),
+        BotCommand(command="help", description="Help / Справка"),
+        BotCommand(command="support", description="Support / Поддержка"),
+        BotCommand(command="collaborate", description="Collaborate / Сотрудничество"),
+    ])
 
-    # Initialize database
-    await init_db()
-    logger.info("Database initialized")
 
-    # Create bot and dispatcher
+async def _run_polling(bot: Bot, dp: Dispatcher) -> None:
+    # Delete webhook & drop pending updates before starting polling
+    # This ensures clean state and cancels any lingering getUpdates from old instance
+    await bot.delete_webhook(drop_pending_updates=True)
+    # Small delay to let Telegram release the old polling connection
+    await asyncio.sleep(1)
+
+    await _register_commands(bot)
+    logger.info("Webhook cleared, commands registered, starting polling...")
+
+    # Start polling
+    runner = await _start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+
+    logger.info("Bot is running.")
+    try:
+        await dp.start_polling(
+            bot,
+            drop_pending_updates=True,
+            polling_timeout=30,
+        )
+    finally:
+        if runner:
+            await runner.cleanup()
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "mode": BOT_MODE})
+
+
+async def _start_metrics_server(port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/healthz", _health)
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, port).start()
+    logger.info("Metrics server listening on %s:%d", WEBHOOK_HOST, port)
+    return runner
+
+
+async def _run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    app = web.Application()
+    app.router.add_get("/healthz", _health)
+    app.router.add_get("/metrics", metrics_handler)
+    # Verifies X-Telegram-Bot-Api-Secret-Token and hands the update to Dispatcher.feed_update;
+    # Telegram gets its 200 immediately while the handler runs in the background.
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("Webhook server listening on %s:%d%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    # Every replica sets the same URL, so this is idempotent behind a load balancer
+    # (set REPLICAS so they don't serve each other stale cached user state).
+    # The webhook is deliberately not deleted on shutdown: other replicas keep serving it.
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    await _register_commands(bot)
+
+    logger.info("Bot is running.")
+    try:
+        await _shutdown_event.wait()
+    finally:
+        await runner.cleanup()
+
+
+def _create_bot() -> Bot:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    dp = Dispatcher()
+    bot.session.middleware(flood_control)
+    return bot
+
+
+def _create_dispatcher() -> Dispatcher:
+    # FSM state lives in the shared store, so any replica can continue a user's flow
+    dp = Dispatcher(storage=StateStoreStorage(create_state_store()))
     dp.include_router(router)
+    return dp
+
 
+def _install_signal_handlers() -> None:
+    global _shutdown_event
     _shutdown_event = asyncio.Event()
 
     # Graceful shutdown on SIGTERM (sent by Render during deploys)
@@ -46,32 +151,130 @@ async def main() -> None:
     for sig in (signal.SIGTERM, signal.SIGINT):
         loop.add_signal_handler(sig, _handle_signal, sig)
 
-    # Delete webhook & drop pending updates before starting polling
-    # This ensures clean state and cancels any lingering getUpdates from old instance
-    await bot.delete_webhook(drop_pending_updates=True)
-    # Small delay to let Telegram release the old polling connection
-    await asyncio.sleep(1)
 
-    # Register bot commands so they appear in Telegram's menu
-    await bot.set_my_commands([
-        BotCommand(command="start", description="Start over / Начать сначала"),
-        BotCommand(command="settings", description="Settings / Настройки"),
-        BotCommand(command="help", description="Help / Справка"),
-        BotCommand(command="support", description="Support / Поддержка"),
-        BotCommand(command="collaborate", description="Collaborate / Сотрудничество"),
-    ])
+async def _run_worker(shard: int, updates: Queue) -> None:
+    setup_logging()
+    start_usage_writer()
+    # Compaction is a pass over shared tables; one worker running it is enough
+    if shard == 0:
+        start_stats_compactor()
+    bot = _create_bot()
+    dp = _create_dispatcher()
+    runner = await _start_metrics_server(METRICS_PORT + 1 + shard) if METRICS_PORT else None
 
-    logger.info("Webhook cleared, commands registered, starting polling...")
+    logger.info("Worker %d is running.", shard)
+    try:
+        await consume(updates, lambda update: dp.feed_raw_update(bot, update))
+    finally:
+        if runner:
+            await runner.cleanup()
+        await stop_stats_compactor()
+        await stop_usage_writer()
+        await dp.storage.close()
+        await bot.session.close()
+        logger.info("Worker %d stopped cleanly.", shard)
 
-    # Start polling
-    logger.info("Bot is running.")
+
+def _worker_main(shard: int, updates: Queue) -> None:
+    # Ctrl+C reaches the whole process group; the supervisor decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(shard, updates))
+
+
+async def _run_supervisor() -> None:
+    """Receive updates here and process them in WORKERS processes (see sharding.py)."""
+    if DB_URL.startswith("sqlite"):
+        logger.warning("SQLite allows one writer at a time across all workers; use Postgres with WORKERS > 1")
+    supervisor = Supervisor(_worker_main, WORKERS, WORKER_SHUTDOWN_TIMEOUT)
+    supervisor.register_metrics()
+    supervisor.start()
+
+    restarts: set[asyncio.Task] = set()
+
+    def _restart() -> None:
+        logger.info("Received SIGHUP, restarting workers one by one...")
+        task = asyncio.create_task(supervisor.restart())
+        restarts.add(task)
+        task.add_done_callback(restarts.discard)
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _restart)
+
+    # Only used for setup calls; updates are sent on from the raw JSON
+    bot = _create_bot()
+    allowed_updates = router.resolve_used_update_types()
+    runner = None
     try:
-        await dp.start_polling(
-            bot,
-            drop_pending_updates=True,
-            polling_timeout=30,
-        )
+        if BOT_MODE == "webhook":
+            async def _receive(request: web.Request) -> web.Response:
+                token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                if not secrets.compare_digest(token, WEBHOOK_SECRET):
+                    return web.Response(status=401)
+                supervisor.dispatch(await request.json())
+                return web.Response()
+
+            app = web.Application()
+            app.router.add_get("/healthz", _health)
+            app.router.add_get("/metrics", metrics_handler)
+            app.router.add_post(WEBHOOK_PATH, _receive)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            logger.info("Webhook server listening on %s:%d%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+            await bot.set_webhook(
+                WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
+            )
+            await _register_commands(bot)
+            logger.info("Supervisor is running with %d workers.", WORKERS)
+            await _shutdown_event.wait()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await asyncio.sleep(1)
+            await _register_commands(bot)
+            runner = await _start_metrics_server(METRICS_PORT) if METRICS_PORT else None
+            logger.info("Supervisor is polling with %d workers.", WORKERS)
+            await poll_updates(
+                bot.session.api.api_url(bot.token, "getUpdates"),
+                allowed_updates,
+                supervisor.dispatch,
+                _shutdown_event,
+            )
+    finally:
+        if runner:
+            await runner.cleanup()
+        await bot.session.close()
+        await supervisor.stop()
+        logger.info("Bot stopped cleanly.")
+
+
+async def main() -> None:
+    setup_logging()
+    logger.info("Starting Serbian Tutor Bot (%s mode, %d workers)...", BOT_MODE, WORKERS)
+
+    # Initialize database
+    await init_db()
+    logger.info("Database initialized")
+    _install_signal_handlers()
+    if WORKERS > 1:
+        await _run_supervisor()
+        return
+
+    start_usage_writer()
+    start_stats_compactor()
+
+    bot = _create_bot()
+    dp = _create_dispatcher()
+
+    try:
+        if BOT_MODE == "webhook":
+            await _run_webhook(bot, dp)
+        else:
+            await _run_polling(bot, dp)
     finally:
+        await stop_stats_compactor()
+        await stop_usage_writer()
+        await dp.storage.close()
         await bot.session.close()
         logger.info("Bot stopped cleanly.")
 
@@ -8,6 +8,9 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://routellm.abacus.ai/v1")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# Optional overrides, e.g. a local Bot API server or the benchmark stand-ins in bench/
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN is not set")
@@ -16,11 +19,93 @@ if not LLM_API_KEY:
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY is not set")
 
+# Update ingestion: "polling" (single instance) or "webhook" (HTTP server, can run several replicas)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # public https URL Telegram posts to
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+# Instances serving this bot behind one load balancer (webhook mode). Telegram can't route by
+# user, so with more than one any replica may get any user's update: the per-process caches of
+# user settings and conversation history are turned off (reads go to the DB instead of serving
+# a copy another replica has since changed), and the per-user job lock only holds per replica.
+REPLICAS = int(os.getenv("REPLICAS", "1"))
+# Prometheus /metrics: served on the webhook server; in polling mode on this port (0 = off)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Supervisor mode: >1 starts this many worker processes, each user pinned to one of them by
+# telegram id so their updates stay in order. Concurrency caps, DB pools and caches are per
+# worker; the global Telegram rate is split between them. With METRICS_PORT set, worker N also
+# serves its own /metrics on METRICS_PORT + 1 + N.
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Seconds a worker gets to finish its in-flight updates when restarted (SIGHUP) or stopped
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))
+
+if REPLICAS < 1:
+    raise ValueError(f"REPLICAS must be at least 1, got {REPLICAS}")
+if REPLICAS > 1 and BOT_MODE != "webhook":
+    raise ValueError("REPLICAS > 1 needs BOT_MODE=webhook (only one instance may poll)")
+if WORKERS < 1:
+    raise ValueError(f"WORKERS must be at least 1, got {WORKERS}")
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"BOT_MODE must be 'polling' or 'webhook', got {BOT_MODE!r}")
+if BOT_MODE == "webhook" and not (WEBHOOK_BASE_URL and WEBHOOK_SECRET):
+    raise ValueError("WEBHOOK_BASE_URL and WEBHOOK_SECRET must be set in webhook mode")
+
 # Models (configurable via env)
 WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
 TTS_MODEL = os.getenv("TTS_MODEL", "tts-1-hd")
 TTS_VOICE = os.getenv("TTS_VOICE", "shimmer")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", CHAT_MODEL)
+
+# LLM deadlines per attempt: until the first token, between tokens, and for the whole reply
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "20"))
+LLM_STALL_TIMEOUT = float(os.getenv("LLM_STALL_TIMEOUT", "10"))
+LLM_TOTAL_TIMEOUT = float(os.getenv("LLM_TOTAL_TIMEOUT", "60"))
+# Hedge route: if the primary hasn't produced a token by its recent p95 time to first token
+# (clamped to the bounds below), the same request also goes here and the first to answer wins.
+# Off unless LLM_FALLBACK_MODEL is set, since a hedged request may be paid for twice.
+# The route defaults to OpenAI directly (OPENAI_BASE_URL / OPENAI_API_KEY).
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_FALLBACK_BASE_URL = os.getenv("LLM_FALLBACK_BASE_URL") or OPENAI_BASE_URL
+LLM_FALLBACK_API_KEY = os.getenv("LLM_FALLBACK_API_KEY", OPENAI_API_KEY)
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "4"))  # until enough samples for a p95
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1"))
+LLM_HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "8"))
+# Ask for token usage at the end of streamed replies (stream_options.include_usage); turn off
+# for an OpenAI-compatible provider that rejects the option
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1").lower() in ("1", "true", "yes")
+# Sentences are batched until at least this many chars before each pipelined TTS request
+TTS_MIN_CHUNK_CHARS = int(os.getenv("TTS_MIN_CHUNK_CHARS", "40"))
+
+# Voice notes are buffered in memory and only spill to a temp file above this size
+AUDIO_SPOOL_MAX_BYTES = int(os.getenv("AUDIO_SPOOL_MAX_MB", "5")) * 1024 * 1024
+# Longer voice notes are refused before download
+VOICE_MAX_DURATION = int(os.getenv("VOICE_MAX_DURATION", "300"))
+# Silence trimming and mono 16 kHz downmix before Whisper (needs ffmpeg)
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "1").lower() in ("1", "true", "yes")
+AUDIO_PREPROCESS_WORKERS = int(os.getenv("AUDIO_PREPROCESS_WORKERS", "2"))
+VOICE_SILENCE_DBFS = float(os.getenv("VOICE_SILENCE_DBFS", "-45"))
+VOICE_KEEP_SILENCE_MS = int(os.getenv("VOICE_KEEP_SILENCE_MS", "200"))
+
+# Whisper results by (voice file_unique_id, model, script), so forwarded or re-sent
+# voice notes are neither downloaded nor transcribed again
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv("TRANSCRIPTION_CACHE_SIZE", "5000"))
+TRANSCRIPTION_CACHE_TTL = float(os.getenv("TRANSCRIPTION_CACHE_TTL", "86400"))
+
+# Exact-match cache of tutor replies to a first message (no conversation history yet), keyed
+# by the normalized text and the user's settings; styles listed here are never cached
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "21600"))
+RESPONSE_CACHE_DISABLED_STYLES = {
+    s.strip() for s in os.getenv("RESPONSE_CACHE_DISABLED_STYLES", "").split(",") if s.strip()
+}
+
+# Synthesized audio cache; set TTS_CACHE_DIR to an empty string for memory-only
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024
 
 # Database
 DB_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///serbian_tutor.db")
@@ -30,6 +115,65 @@ if DB_URL.startswith("postgres://"):
 elif DB_URL.startswith("postgresql://"):
     DB_URL = DB_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 
+# Concurrency caps for provider calls; extra requests queue with Pro users first
+STT_CONCURRENCY = int(os.getenv("STT_CONCURRENCY", "4"))
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "8"))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "8"))
+# Tell the user their place in line once at least this many requests are queued ahead
+QUEUE_NOTICE_THRESHOLD = int(os.getenv("QUEUE_NOTICE_THRESHOLD", "3"))
+
+# DB connection pool. Every chat/STT job in flight can hold a connection (history load,
+# memory write), plus a few for the usage writer and stats compactor.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(CHAT_CONCURRENCY)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(STT_CONCURRENCY + 2)))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Prepared statements cached per asyncpg connection; set to 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+
+# Minimum seconds between progressive edits of a streamed reply (Telegram rate-limits edits)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Outbound Telegram flood control: requests/s overall and per chat, the per-chat burst
+# (enough for one voice exchange: notice, transcription, reply, edits, audio),
+# how many requests may wait before callers block, and retries after a 429
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "6"))
+TELEGRAM_MAX_PENDING = int(os.getenv("TELEGRAM_MAX_PENDING", "500"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# In-process cache of user settings (in front of the users table)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000" if REPLICAS == 1 else "0"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# Telegram file_ids of uploaded TTS audio, by content hash (DB table with this in-memory front)
+FILE_ID_CACHE_SIZE = int(os.getenv("FILE_ID_CACHE_SIZE", "10000"))
+FILE_ID_CACHE_TTL = float(os.getenv("FILE_ID_CACHE_TTL", "86400"))
+
+# Conversation memory: history is trimmed to a token budget, older turns are folded into a summary
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "40"))
+MEMORY_CACHE_USERS = int(os.getenv("MEMORY_CACHE_USERS", "2000" if REPLICAS == 1 else "0"))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "1800"))
+
+# Voice usage events are buffered and written every N rows or T milliseconds
+USAGE_LOG_BATCH_SIZE = int(os.getenv("USAGE_LOG_BATCH_SIZE", "100"))
+USAGE_LOG_FLUSH_INTERVAL = int(os.getenv("USAGE_LOG_FLUSH_MS", "2000")) / 1000
+
+# Conversation (FSM) state: "memory", "database" or "redis". It is read on every update, so a
+# single replica keeps it in memory; several replicas need a shared store.
+STATE_STORE = os.getenv("STATE_STORE", "memory" if REPLICAS == 1 else "database")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Unfinished flows (e.g. /support without a follow-up message) expire after this many seconds
+STATE_TTL = float(os.getenv("STATE_TTL", "86400"))
+
+if STATE_STORE not in ("memory", "database", "redis"):
+    raise ValueError(f"STATE_STORE must be 'memory', 'database' or 'redis', got {STATE_STORE!r}")
+
+# Seconds between passes of the job that folds new rows into the /admin_stats rollups
+STATS_COMPACT_INTERVAL = float(os.getenv("STATS_COMPACT_INTERVAL", "60"))
+
 # Admin
 ADMIN_ID = int(os.getenv("ADMIN_ID", "485544391"))
 
@@ -1,17 +1,112 @@
 from __future__ import annotations
 
+import asyncio
 import datetime
+import logging
+import time
+from collections import Counter, defaultdict
 from datetime import timedelta
 
-from sqlalchemy import BigInteger, Boolean, String, DateTime, func, select
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import (
+    BigInteger, Boolean, Integer, String, Text, DateTime, delete, event, func, insert, literal, select, true,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import metrics
+from cache import TTLCache
+from config import (
+    DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_STATEMENT_CACHE_SIZE,
+    FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_TTL, USAGE_LOG_BATCH_SIZE, USAGE_LOG_FLUSH_INTERVAL,
+    STATS_COMPACT_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+_POOL_WAIT = metrics.Histogram(
+    "tutor_db_pool_checkout_seconds",
+    "Time to get a DB connection from the pool (waiting for a free one, connecting, pre-ping).",
+    ("outcome",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 10.0),
+)
+
+
+class _TimedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records checkout latency, so exhaustion shows up before it becomes user latency."""
+
+    def connect(self):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            connection = super().connect()
+            outcome = "ok"
+            return connection
+        finally:
+            _POOL_WAIT.observe(time.perf_counter() - start, outcome=outcome)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # WAL lets readers proceed while one writer commits; NORMAL only fsyncs at checkpoints
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    """Engine with pool and driver settings for the backend in `url`."""
+    if url.startswith("sqlite") and ":memory:" in url:
+        # Each pooled connection would get its own empty in-memory database
+        return create_async_engine(url, echo=False)
+
+    pool_args = {
+        "poolclass": _TimedPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if url.startswith("postgresql"):
+        return create_async_engine(
+            url,
+            echo=False,
+            pool_pre_ping=True,
+            pool_recycle=DB_POOL_RECYCLE,
+            connect_args={
+                # asyncpg's own cache and SQLAlchemy's adapter cache on top of it
+                "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+                "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            },
+            **pool_args,
+        )
+
+    sqlite_engine = create_async_engine(url, echo=False, **pool_args)
+    event.listen(sqlite_engine.sync_engine, "connect", _sqlite_pragmas)
+    return sqlite_engine
 
-from config import DB_URL
 
-engine = create_async_engine(DB_URL, echo=False)
+engine = _create_engine(DB_URL)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+metrics.Gauge(
+    "tutor_db_pool_connections", "DB pool connections by state.", ("state",),
+    fn=lambda: {
+        ("checked_out",): engine.pool.checkedout(),
+        ("idle",): engine.pool.checkedin(),
+        ("overflow",): max(engine.pool.overflow(), 0),
+    } if isinstance(engine.pool, AsyncAdaptedQueuePool) else {},
+)
+
+# Write-through cache of User rows keyed by telegram_id. Every write path below
+# stores the refreshed row here, so reads only hit the DB on a miss or after TTL.
+_user_cache: TTLCache[int, User] = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+# content hash -> Telegram file_id, in front of the telegram_files table
+_file_id_cache: TTLCache[str, str] = TTLCache(FILE_ID_CACHE_SIZE, FILE_ID_CACHE_TTL)
+
 
 class Base(DeclarativeBase):
     pass
@@ -33,6 +128,12 @@ class User(Base):
         DateTime, default=datetime.datetime.utcnow
     )
 
+    @property
+    def has_active_pro(self) -> bool:
+        return self.is_pro and (
+            self.pro_expires_at is None or self.pro_expires_at > datetime.datetime.utcnow()
+        )
+
 
 class VoiceLog(Base):
     __tablename__ = "voice_logs"
@@ -44,186 +145,624 @@ class VoiceLog(Base):
     )
 
 
+class ConversationTurn(Base):
+    __tablename__ = "conversation_turns"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, index=True)
+    role: Mapped[str] = mapped_column(String(16))
+    content: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow
+    )
+
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    summary: Mapped[str] = mapped_column(Text, default="")
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow
+    )
+
+
+class StateEntry(Base):
+    """Key-value rows behind DatabaseStateStore (FSM state shared by all replicas)."""
+
+    __tablename__ = "state_store"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    value: Mapped[str] = mapped_column(Text)
+    expires_at: Mapped[datetime.datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+
+
+class TelegramFile(Base):
+    """file_id Telegram assigned to a file we uploaded, keyed by sha256 of its content."""
+
+    __tablename__ = "telegram_files"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(255))
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime, default=datetime.datetime.utcnow
+    )
+
+
+# --- Stats rollups (maintained by compact_stats, read by get_admin_stats) ---
+
+
+class HourlyStat(Base):
+    __tablename__ = "stats_hourly"
+
+    hour: Mapped[datetime.datetime] = mapped_column(DateTime, primary_key=True)
+    new_users: Mapped[int] = mapped_column(Integer, default=0)
+    voices: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class RefSourceStat(Base):
+    __tablename__ = "stats_ref_sources"
+
+    # "" stands for users who came without a ref source
+    ref_source: Mapped[str] = mapped_column(String(50), primary_key=True)
+    users: Mapped[int] = mapped_column(Integer, default=0, index=True)
+
+
+class StatCounter(Base):
+    __tablename__ = "stats_counters"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+# users_total/pro_users are served to /admin_stats; the watermarks are the last
+# users.id / voice_logs.id already folded into the rollups.
+_STAT_COUNTERS = ("users_total", "pro_users", "users_watermark", "voices_watermark")
+
+
 async def init_db() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # pro_users is kept up to date by activate_promo; seed it for a database that predates it
+        pro_users = select(func.count(User.id)).where(User.is_pro == True).scalar_subquery()  # noqa: E712
+        await conn.execute(
+            _insert(StatCounter)
+            .values([{"name": name, "value": pro_users if name == "pro_users" else 0} for name in _STAT_COUNTERS])
+            .on_conflict_do_nothing()
+        )
+
+
+def get_user_cache_stats() -> dict[str, int]:
+    """Hit/miss counters of the user settings cache."""
+    return _user_cache.stats()
+
+
+metrics.Counter("tutor_user_cache_lookups_total", "User settings cache lookups by result.", ("result",),
+                fn=lambda: {("hit",): _user_cache.stats()["hits"], ("miss",): _user_cache.stats()["misses"]})
 
 
 async def get_or_create_user(telegram_id: int) -> User:
+    cached = _user_cache.get(telegram_id)
+    if cached is not None:
+        return cached
+    with metrics.span("db.get_or_create_user"):
+        async with async_session() as session:
+            result = await session.execute(
+                select(User).where(User.telegram_id == telegram_id)
+            )
+            user = result.scalar_one_or_none()
+            if user is None:
+                user = User(telegram_id=telegram_id)
+                session.add(user)
+                await session.commit()
+                await session.refresh(user)
+            _user_cache.set(telegram_id, user)
+            return user
+
+
+def _insert(table):
+    """Dialect-specific INSERT construct, which supports ON CONFLICT on both backends."""
+    if engine.dialect.name == "postgresql":
+        return pg_insert(table)
+    return sqlite_insert(table)
+
+
+@metrics.traced("db.upsert_user")
+async def upsert_user(
+    telegram_id: int, values: dict, insert_only: dict | None = None,
+) -> User:
+    """Set user columns in one INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement.
+
+    `values` are written whether or not the row exists; `insert_only` columns are
+    only used when the row is created.
+    """
     async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id)
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
-        return user
+        user = await _upsert_user(session, telegram_id, values, insert_only)
+        await session.commit()
+    _user_cache.set(telegram_id, user)
+    return user
+
+
+async def _upsert_user(
+    session: AsyncSession, telegram_id: int, values: dict, insert_only: dict | None = None,
+) -> User:
+    stmt = (
+        _insert(User)
+        .values(telegram_id=telegram_id, **(insert_only or {}), **values)
+        .on_conflict_do_update(index_elements=[User.telegram_id], set_=values)
+        .returning(User)
+    )
+    result = await session.scalars(stmt, execution_options={"populate_existing": True})
+    return result.one()
 
 
 async def reset_user_settings(telegram_id: int, ref_source: str | None = None) -> User:
     """Reset user settings for re-onboarding. Save ref_source only on first creation."""
+    return await upsert_user(
+        telegram_id,
+        {"dialect": "", "script": "", "style": ""},
+        insert_only={"ref_source": ref_source},
+    )
+
+
+async def update_user_dialect(telegram_id: int, dialect: str) -> User:
+    return await upsert_user(telegram_id, {"dialect": dialect})
+
+
+async def update_user_script(telegram_id: int, script: str) -> User:
+    return await upsert_user(telegram_id, {"script": script})
+
+
+async def update_user_style(telegram_id: int, style: str) -> User:
+    return await upsert_user(telegram_id, {"style": style})
+
+
+async def update_user_language(telegram_id: int, language: str) -> User:
+    return await upsert_user(telegram_id, {"ui_language": language})
+
+
+# --- Voice logging ---
+
+
+class _UsageLogWriter:
+    """Buffers voice usage events in memory and bulk-inserts them in the background.
+
+    A flush happens every `interval` seconds or as soon as `batch_size` rows are
+    buffered, whichever comes first, as one multi-row INSERT.
+    """
+
+    def __init__(self, batch_size: int, interval: float) -> None:
+        self.batch_size = batch_size
+        self.interval = interval
+        self._rows: list[dict] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def add(self, telegram_id: int) -> None:
+        self._rows.append({"telegram_id": telegram_id, "created_at": datetime.datetime.utcnow()})
+        if len(self._rows) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Let the loop finish a flush in progress rather than cancelling it, which
+        # would lose the rows it has already taken out of the buffer
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        try:
+            with metrics.span("db.usage_log_flush"):
+                async with async_session() as session:
+                    await session.execute(insert(VoiceLog).values(rows))
+                    await session.commit()
+        except Exception:
+            logger.exception("Failed to write %d voice log rows", len(rows))
+            # Keep them for the next flush, but don't grow without bound while the DB is down
+            self._rows[:0] = rows[-self.batch_size * 10:]
+
+
+_usage_writer = _UsageLogWriter(USAGE_LOG_BATCH_SIZE, USAGE_LOG_FLUSH_INTERVAL)
+
+
+def start_usage_writer() -> None:
+    """Start the background flusher for voice usage events."""
+    _usage_writer.start()
+
+
+async def stop_usage_writer() -> None:
+    """Stop the background flusher and write out anything still buffered."""
+    await _usage_writer.stop()
+
+
+def log_voice_message(telegram_id: int) -> None:
+    """Log a voice message interaction (buffered, written in batches)."""
+    _usage_writer.add(telegram_id)
+
+
+# --- Conversation memory ---
+
+
+@metrics.traced("db.load_conversation")
+async def load_conversation(telegram_id: int, limit: int) -> tuple[str, list[tuple[int, str, str]]]:
+    """Rolling summary and the newest `limit` turns as (id, role, content), oldest first."""
     async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id, ref_source=ref_source)
-            session.add(user)
-        else:
-            user.dialect = ""
-            user.script = ""
-            user.style = ""
-            # Don't overwrite ref_source on re-/start
+        summary = (await session.execute(
+            select(ConversationSummary.summary).where(ConversationSummary.telegram_id == telegram_id)
+        )).scalar() or ""
+        rows = (await session.execute(
+            select(ConversationTurn.id, ConversationTurn.role, ConversationTurn.content)
+            .where(ConversationTurn.telegram_id == telegram_id)
+            .order_by(ConversationTurn.id.desc())
+            .limit(limit)
+        )).all()
+    return summary, [tuple(row) for row in reversed(rows)]
+
+
+@metrics.traced("db.append_conversation_turns")
+async def append_conversation_turns(telegram_id: int, turns: list[tuple[str, str]]) -> list[int]:
+    """Insert (role, content) turns in one statement and return their ids."""
+    async with async_session() as session:
+        ids = (await session.scalars(
+            insert(ConversationTurn)
+            .values([{"telegram_id": telegram_id, "role": role, "content": content} for role, content in turns])
+            .returning(ConversationTurn.id)
+        )).all()
         await session.commit()
-        await session.refresh(user)
-        return user
+    return sorted(ids)
 
 
-async def update_user_dialect(telegram_id: int, dialect: str) -> User:
+@metrics.traced("db.compact_conversation")
+async def compact_conversation(
+    telegram_id: int, summary: str, turn_ids: list[int], previous_summary: str,
+) -> bool:
+    """Replace the given turns (the ones folded into it) by the new rolling summary.
+
+    Nothing is written, and False is returned, if the stored summary is no longer
+    `previous_summary`, i.e. another compaction finished first.
+    """
+    now = datetime.datetime.utcnow()
     async with async_session() as session:
         result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+            update(ConversationSummary)
+            .where(ConversationSummary.telegram_id == telegram_id,
+                   ConversationSummary.summary == previous_summary)
+            .values(summary=summary, updated_at=now)
+        )
+        if not result.rowcount and not previous_summary:
+            result = await session.execute(
+                _insert(ConversationSummary)
+                .values(telegram_id=telegram_id, summary=summary, updated_at=now)
+                .on_conflict_do_nothing(index_elements=[ConversationSummary.telegram_id])
+            )
+        if not result.rowcount:
+            await session.rollback()
+            return False
+        await session.execute(
+            delete(ConversationTurn)
+            .where(ConversationTurn.telegram_id == telegram_id, ConversationTurn.id.in_(turn_ids))
         )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id, dialect=dialect)
-            session.add(user)
-        else:
-            user.dialect = dialect
         await session.commit()
-        await session.refresh(user)
-        return user
+    return True
 
 
-async def update_user_script(telegram_id: int, script: str) -> User:
+@metrics.traced("db.clear_conversation")
+async def clear_conversation(telegram_id: int) -> None:
     async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+        await session.execute(delete(ConversationTurn).where(ConversationTurn.telegram_id == telegram_id))
+        await session.execute(
+            delete(ConversationSummary).where(ConversationSummary.telegram_id == telegram_id)
         )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id, script=script)
-            session.add(user)
-        else:
-            user.script = script
         await session.commit()
-        await session.refresh(user)
-        return user
 
 
-async def update_user_style(telegram_id: int, style: str) -> User:
+# --- Shared state store ---
+
+
+@metrics.traced("db.state_get_many")
+async def state_get_many(keys: list[str]) -> dict[str, str]:
+    """Values of the keys that exist and haven't expired, in one query."""
+    now = datetime.datetime.utcnow()
     async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
-        )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id, style=style)
-            session.add(user)
-        else:
-            user.style = style
+        rows = (await session.execute(
+            select(StateEntry.key, StateEntry.value).where(
+                StateEntry.key.in_(keys),
+                (StateEntry.expires_at.is_(None)) | (StateEntry.expires_at > now),
+            )
+        )).all()
+    return {key: value for key, value in rows}
+
+
+@metrics.traced("db.state_set")
+async def state_set(key: str, value: str, expires_at: datetime.datetime | None) -> None:
+    stmt = _insert(StateEntry).values(key=key, value=value, expires_at=expires_at)
+    async with async_session() as session:
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[StateEntry.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        ))
         await session.commit()
-        await session.refresh(user)
-        return user
 
 
-async def update_user_language(telegram_id: int, language: str) -> User:
+@metrics.traced("db.state_delete")
+async def state_delete(keys: list[str]) -> None:
+    async with async_session() as session:
+        await session.execute(delete(StateEntry).where(StateEntry.key.in_(keys)))
+        await session.commit()
+
+
+async def purge_expired_state() -> int:
+    """Delete expired rows (reads already ignore them); returns how many were removed."""
     async with async_session() as session:
         result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+            delete(StateEntry).where(StateEntry.expires_at <= datetime.datetime.utcnow())
         )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id, ui_language=language)
-            session.add(user)
-        else:
-            user.ui_language = language
         await session.commit()
-        await session.refresh(user)
-        return user
+    return result.rowcount
 
 
-# --- Voice logging ---
+# --- Telegram file_ids ---
 
 
-async def log_voice_message(telegram_id: int) -> None:
-    """Log a voice message interaction."""
+async def get_telegram_file_id(content_hash: str) -> str | None:
+    file_id = _file_id_cache.get(content_hash)
+    if file_id is not None:
+        return file_id
+    with metrics.span("db.get_telegram_file_id"):
+        async with async_session() as session:
+            file_id = await session.scalar(
+                select(TelegramFile.file_id).where(TelegramFile.content_hash == content_hash)
+            )
+    if file_id is not None:
+        _file_id_cache.set(content_hash, file_id)
+    return file_id
+
+
+@metrics.traced("db.save_telegram_file_id")
+async def save_telegram_file_id(content_hash: str, file_id: str) -> None:
+    stmt = _insert(TelegramFile).values(content_hash=content_hash, file_id=file_id)
+    async with async_session() as session:
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[TelegramFile.content_hash], set_={"file_id": stmt.excluded.file_id},
+        ))
+        await session.commit()
+    _file_id_cache.set(content_hash, file_id)
+
+
+@metrics.traced("db.forget_telegram_file_id")
+async def forget_telegram_file_id(content_hash: str) -> None:
+    """Drop a file_id Telegram no longer accepts."""
+    _file_id_cache.pop(content_hash)
     async with async_session() as session:
-        session.add(VoiceLog(telegram_id=telegram_id))
+        await session.execute(delete(TelegramFile).where(TelegramFile.content_hash == content_hash))
         await session.commit()
 
 
 # --- Promo codes ---
 
 
+@metrics.traced("db.activate_promo")
 async def activate_promo(telegram_id: int, days: int) -> User:
-    """Activate pro status for a user."""
+    """Activate pro status for a user, counting them in pro_users if they weren't Pro yet."""
     async with async_session() as session:
-        result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+        # Row lock on Postgres, so two activations at once count the user only once
+        was_pro = await session.scalar(
+            select(User.is_pro).where(User.telegram_id == telegram_id).with_for_update()
         )
-        user = result.scalar_one_or_none()
-        if user is None:
-            user = User(telegram_id=telegram_id, is_pro=True,
-                        pro_expires_at=datetime.datetime.utcnow() + timedelta(days=days))
-            session.add(user)
-        else:
-            user.is_pro = True
-            user.pro_expires_at = datetime.datetime.utcnow() + timedelta(days=days)
+        user = await _upsert_user(session, telegram_id, {
+            "is_pro": True,
+            "pro_expires_at": datetime.datetime.utcnow() + timedelta(days=days),
+        })
+        if not was_pro:
+            await session.execute(
+                update(StatCounter).where(StatCounter.name == "pro_users")
+                .values(value=StatCounter.value + 1)
+            )
         await session.commit()
-        await session.refresh(user)
-        return user
+    _user_cache.set(telegram_id, user)
+    return user
 
 
 # --- Admin stats ---
 
+# Rows per compaction pass; a backlog (e.g. the first run on an existing DB) takes several passes
+_COMPACT_BATCH = 5000
+# Rows younger than this are left for the next pass, so a transaction that commits a lower
+# id late (or a buffered voice log stamped before its insert) is never skipped
+_COMPACT_LAG = timedelta(seconds=60)
+
+_compactor_task: asyncio.Task | None = None
+
+
+def _hour(moment: datetime.datetime) -> datetime.datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
 
+
+def _settled(rows: list, cutoff: datetime.datetime) -> list:
+    """Longest id-ordered prefix of rows created before `cutoff`."""
+    for i, row in enumerate(rows):
+        if row.created_at >= cutoff:
+            return rows[:i]
+    return rows
+
+
+async def _advance_watermark(session: AsyncSession, name: str, old: int, new: int) -> bool:
+    """Compare-and-swap a watermark so two replicas never fold the same rows twice."""
+    result = await session.execute(
+        update(StatCounter)
+        .where(StatCounter.name == name, StatCounter.value == old)
+        .values(value=new)
+    )
+    return result.rowcount == 1
+
+
+@metrics.traced("db.compact_stats")
+async def compact_stats() -> int:
+    """Fold users and voice logs added since the last pass into the rollup tables.
+
+    Returns the number of source rows folded.
+    """
+    cutoff = datetime.datetime.utcnow() - _COMPACT_LAG
+
+    async with async_session() as session:
+        counters = dict((await session.execute(select(StatCounter.name, StatCounter.value))).all())
+        users_wm = counters.get("users_watermark", 0)
+        voices_wm = counters.get("voices_watermark", 0)
+
+        users = _settled((await session.execute(
+            select(User.id, User.created_at, User.ref_source)
+            .where(User.id > users_wm).order_by(User.id).limit(_COMPACT_BATCH)
+        )).all(), cutoff)
+        voices = _settled((await session.execute(
+            select(VoiceLog.id, VoiceLog.created_at)
+            .where(VoiceLog.id > voices_wm).order_by(VoiceLog.id).limit(_COMPACT_BATCH)
+        )).all(), cutoff)
+        hourly: dict[datetime.datetime, list[int]] = defaultdict(lambda: [0, 0])
+        refs: Counter[str] = Counter()
+        for row in users:
+            hourly[_hour(row.created_at)][0] += 1
+            refs[row.ref_source or ""] += 1
+        for row in voices:
+            hourly[_hour(row.created_at)][1] += 1
+
+        if users and not await _advance_watermark(session, "users_watermark", users_wm, users[-1].id):
+            await session.rollback()
+            return 0
+        if voices and not await _advance_watermark(session, "voices_watermark", voices_wm, voices[-1].id):
+            await session.rollback()
+            return 0
+
+        if hourly:
+            stmt = _insert(HourlyStat).values([
+                {"hour": hour, "new_users": n_users, "voices": n_voices}
+                for hour, (n_users, n_voices) in hourly.items()
+            ])
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[HourlyStat.hour],
+                set_={
+                    "new_users": HourlyStat.new_users + stmt.excluded.new_users,
+                    "voices": HourlyStat.voices + stmt.excluded.voices,
+                },
+            ))
+        if refs:
+            stmt = _insert(RefSourceStat).values([
+                {"ref_source": source, "users": count} for source, count in refs.items()
+            ])
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[RefSourceStat.ref_source],
+                set_={"users": RefSourceStat.users + stmt.excluded.users},
+            ))
+        await session.execute(
+            update(StatCounter).where(StatCounter.name == "users_total")
+            .values(value=StatCounter.value + len(users))
+        )
+        await session.commit()
+
+    return len(users) + len(voices)
+
+
+async def _run_compactor() -> None:
+    while True:
+        try:
+            # Keep going while there is a backlog, then wait for the next interval
+            while await compact_stats() >= _COMPACT_BATCH:
+                pass
+        except Exception:
+            logger.exception("Stats compaction failed")
+        await asyncio.sleep(STATS_COMPACT_INTERVAL)
+
+
+def start_stats_compactor() -> None:
+    """Start the periodic background job that maintains the stats rollups."""
+    global _compactor_task
+    if _compactor_task is None:
+        _compactor_task = asyncio.create_task(_run_compactor())
+
+
+async def stop_stats_compactor() -> None:
+    global _compactor_task
+    if _compactor_task is not None:
+        _compactor_task.cancel()
+        try:
+            await _compactor_task
+        except asyncio.CancelledError:
+            pass
+        _compactor_task = None
+
+
+@metrics.traced("db.get_admin_stats")
 async def get_admin_stats() -> dict:
-    """Get statistics for admin dashboard."""
+    """Get statistics for admin dashboard from the rollup tables.
+
+    Figures lag the live tables by up to STATS_COMPACT_INTERVAL plus a minute.
+    """
     now = datetime.datetime.utcnow()
-    day_ago = now - timedelta(days=1)
-    week_ago = now - timedelta(days=7)
+    day_ago = _hour(now - timedelta(days=1))
+    week_ago = _hour(now - timedelta(days=7))
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
+    def counter(name: str):
+        return select(StatCounter.value).where(StatCounter.name == name).scalar_subquery()
+
+    def hourly_sum(column, since: datetime.datetime):
+        return (
+            select(func.coalesce(func.sum(column), 0))
+            .where(HourlyStat.hour >= since)
+            .scalar_subquery()
+        )
+
+    # Top ref sources, left-joined onto a single row so the query returns the
+    # counters even when there are none
+    top_refs = (
+        select(RefSourceStat.ref_source, RefSourceStat.users)
+        .order_by(RefSourceStat.users.desc())
+        .limit(10)
+        .subquery()
+    )
+    one_row = select(literal(1).label("one")).subquery()
+
     async with async_session() as session:
-        # Total users
-        total = (await session.execute(select(func.count(User.id)))).scalar() or 0
-
-        # New in 24h
-        new_24h = (await session.execute(
-            select(func.count(User.id)).where(User.created_at >= day_ago)
-        )).scalar() or 0
-
-        # New in 7 days
-        new_7d = (await session.execute(
-            select(func.count(User.id)).where(User.created_at >= week_ago)
-        )).scalar() or 0
-
-        # Top ref sources
-        ref_rows = (await session.execute(
-            select(User.ref_source, func.count(User.id))
-            .group_by(User.ref_source)
-            .order_by(func.count(User.id).desc())
-            .limit(10)
+        rows = (await session.execute(
+            select(
+                counter("users_total"),
+                hourly_sum(HourlyStat.new_users, day_ago),
+                hourly_sum(HourlyStat.new_users, week_ago),
+                hourly_sum(HourlyStat.voices, today_start),
+                counter("pro_users"),
+                top_refs.c.ref_source,
+                top_refs.c.users,
+            )
+            .select_from(one_row.outerjoin(top_refs, true()))
+            .order_by(top_refs.c.users.desc())
         )).all()
 
-        ref_stats = []
-        for source, count in ref_rows:
-            ref_stats.append((source or "(прямой)", count))
-
-        # Voice messages today
-        voices_today = (await session.execute(
-            select(func.count(VoiceLog.id)).where(VoiceLog.created_at >= today_start)
-        )).scalar() or 0
+    total, new_24h, new_7d, voices_today, pro_count = (value or 0 for value in rows[0][:5])
 
-        # Pro users
-        pro_count = (await session.execute(
-            select(func.count(User.id)).where(User.is_pro == True)  # noqa: E712
-        )).scalar() or 0
+    ref_stats = []
+    for *_, source, count in rows:
+        if count is not None:
+            ref_stats.append((source or "(прямой)", count))
 
     return {
         "total": total,
@@ -1,34 +1,53 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-import os
 import tempfile
-from pathlib import Path
+import time
+from typing import AsyncIterator, Awaitable
 
 from aiogram import Router, Bot, F
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import CommandStart, Command
 from aiogram.filters.command import CommandObject
-from aiogram.types import Message, CallbackQuery, FSInputFile
-
-from config import ADMIN_ID, PROMO_CODES
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, CallbackQuery
+
+from audio import get_audio_stats, preprocess_voice
+from config import (
+    ADMIN_ID, AUDIO_SPOOL_MAX_BYTES, PROMO_CODES, QUEUE_NOTICE_THRESHOLD, STREAM_EDIT_INTERVAL,
+    VOICE_MAX_DURATION,
+)
 from database import (
     get_or_create_user, reset_user_settings, update_user_dialect,
     update_user_language, update_user_script, update_user_style,
-    log_voice_message, activate_promo, get_admin_stats,
+    log_voice_message, activate_promo, get_admin_stats, get_user_cache_stats,
 )
 from i18n import t
 from keyboards import (
     language_keyboard, script_keyboard, dialect_keyboard,
     style_keyboard, settings_keyboard,
 )
-from services import transcribe_voice, get_tutor_response, synthesize_speech, transliterate_to_latin
+from memory import memory
+from metrics import STAGE_SECONDS, HandlerTimer, span
+from scheduler import PRIORITY_FREE, PRIORITY_PRO, PriorityLimiter
+from sender import get_sender_stats, get_upload_stats, send_document_once
+from services import (
+    SpeechPipeline, cache_transcription, chat_limiter, get_cached_transcription, get_llm_route_stats,
+    get_prompt_token_stats, get_queue_stats, get_response_cache_stats, get_transcription_cache_stats,
+    get_tts_cache_stats, stt_limiter, stream_tutor_response, transcribe_voice, user_jobs,
+)
+from transliteration import normalize_script
 
 logger = logging.getLogger(__name__)
 router = Router()
+router.message.middleware(HandlerTimer())
+router.callback_query.middleware(HandlerTimer())
 
-# Users who sent /support and are awaiting their message to forward
-_support_mode: set[int] = set()
+class SupportForm(StatesGroup):
+    # Sent /support; the next text message is forwarded to the admin
+    waiting_message = State()
 
 
 def _user_configured(user) -> bool:
@@ -36,6 +55,98 @@ def _user_configured(user) -> bool:
     return bool(user.dialect and user.script and user.style)
 
 
+def _priority(user) -> int:
+    """Scheduling priority for provider calls: active Pro users go first."""
+    return PRIORITY_PRO if user.has_active_pro else PRIORITY_FREE
+
+
+def _processing_text(limiter: PriorityLimiter, priority: int, lang: str) -> str:
+    """The "processing" notice, or the user's place in line when the queue is long."""
+    ahead = limiter.waiting_ahead(priority)
+    if ahead >= QUEUE_NOTICE_THRESHOLD:
+        return t("queue_position", lang, position=str(ahead + 1))
+    return t("processing", lang)
+
+
+# Appended to intermediate edits while the reply is still streaming
+_STREAM_CURSOR = " ▌"
+
+
+async def _stream_reply(
+    message: Message, chunks: AsyncIterator[str], script: str, target: Message | None = None,
+) -> str:
+    """Progressively show a streamed reply and return the complete text.
+
+    Edits `target` in place, or sends a new message on the first chunk when no
+    target is given. Intermediate edits are throttled to STREAM_EDIT_INTERVAL and
+    sent in the background, so the stream never waits on Telegram; while one is
+    still queued by flood control, newer text replaces it. Edits still outstanding
+    when the stream ends or fails are cancelled, so the final edit always carries
+    the full text. The Serbian part is normalized to the user's script, since the
+    LLM mixes scripts.
+    """
+    text = ""
+    last_edit = 0.0
+    edits: list[asyncio.Task] = []
+
+    try:
+        async for delta in chunks:
+            text += delta
+            now = time.monotonic()
+            if not text.strip() or now - last_edit < STREAM_EDIT_INTERVAL:
+                continue
+            try:
+                if target is None:
+                    target = await message.answer(normalize_script(text, script) + _STREAM_CURSOR)
+                else:
+                    edits = [task for task in edits if not task.done()]
+                    edits.append(asyncio.create_task(
+                        _intermediate_edit(target, normalize_script(text, script) + _STREAM_CURSOR)
+                    ))
+            except (TelegramBadRequest, TelegramRetryAfter) as e:
+                logger.debug("Skipping intermediate stream edit: %s", e)
+            last_edit = now
+    finally:
+        # A queued intermediate edit must not land after the final edit (or the error
+        # message, if the stream failed), nor merge into it
+        for task in edits:
+            task.cancel()
+        await asyncio.gather(*edits, return_exceptions=True)
+
+    text = normalize_script(text, script)
+    if target is None:
+        await message.answer(text)
+    else:
+        try:
+            await target.edit_text(text)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+    return text
+
+
+async def _intermediate_edit(target: Message, text: str) -> None:
+    try:
+        await target.edit_text(text)
+    except (TelegramBadRequest, TelegramRetryAfter) as e:
+        logger.debug("Skipping intermediate stream edit: %s", e)
+
+
+async def _isolated(step: str, aw: Awaitable) -> None:
+    """Await a side step of a reply; its failure is logged and never reaches the rest."""
+    try:
+        await aw
+    except Exception:
+        logger.exception("%s failed", step)
+
+
+async def _send_speech(message: Message, speech: SpeechPipeline) -> None:
+    with span("tts_wait"):
+        tts_audio = await speech.finish()
+    if tts_audio:
+        await send_document_once(message, tts_audio, "srpski_tutor.mp3")
+
+
 # --- Commands ---
 
 
@@ -43,6 +154,7 @@ def _user_configured(user) -> bool:
 async def cmd_start(message: Message, command: CommandObject) -> None:
     ref_source = command.args or None
     await reset_user_settings(message.from_user.id, ref_source=ref_source)
+    await memory.clear(message.from_user.id)
     await message.answer(
         t("welcome", "ru"),
         reply_markup=language_keyboard(),
@@ -59,9 +171,9 @@ async def cmd_help(message: Message) -> None:
 
 
 @router.message(Command("support"))
-async def cmd_support(message: Message) -> None:
+async def cmd_support(message: Message, state: FSMContext) -> None:
     user = await get_or_create_user(message.from_user.id)
-    _support_mode.add(message.from_user.id)
+    await state.set_state(SupportForm.waiting_message)
     await message.answer(
         t("support", user.ui_language),
         parse_mode="HTML",
@@ -113,6 +225,28 @@ async def cmd_admin_stats(message: Message) -> None:
     for source, count in stats["ref_stats"]:
         ref_lines.append(f"  {source} — {count}")
     ref_text = "\n".join(ref_lines) if ref_lines else "  (нет данных)"
+    cache = get_user_cache_stats()
+    tts = get_tts_cache_stats()
+    stt_cache = get_transcription_cache_stats()
+    queue_lines = []
+    for name, q in get_queue_stats().items():
+        waiting = f", ждут {q['waiting']}" if "waiting" in q else ""
+        queue_lines.append(f"  {name}: в работе {q['running']}{waiting}")
+    queue_text = "\n".join(queue_lines)
+    prompt = get_prompt_token_stats()
+    replies = get_response_cache_stats()
+    audio = get_audio_stats()
+    saved = audio["raw_bytes"] - audio["sent_bytes"]
+    stt_lines = []
+    for stage, label in (("stt_preprocessed", "с предобработкой"), ("stt", "без")):
+        count, total = STAGE_SECONDS.totals(stage=stage, outcome="ok")
+        if count:
+            stt_lines.append(f"{total / count:.2f} с {label} (n={count})")
+    stt_text = " / ".join(stt_lines) or "нет данных"
+    stt_text += f", из кэша {stt_cache['hits']} (промахов {stt_cache['misses']})"
+    sender = get_sender_stats()
+    uploads = get_upload_stats()
+    routes = get_llm_route_stats()
 
     text = (
         f"📊 Статистика бота\n\n"
@@ -121,7 +255,28 @@ async def cmd_admin_stats(message: Message) -> None:
         f"📅 Новых за 7 дней: {stats['new_7d']}\n"
         f"⭐ Pro-юзеров: {stats['pro_count']}\n\n"
         f"📣 Топ источников:\n{ref_text}\n\n"
-        f"🎤 Голосовых сегодня: {stats['voices_today']}"
+        f"🎤 Голосовых сегодня: {stats['voices_today']}\n\n"
+        f"🗄 Кэш настроек: {cache['hits']} попаданий / {cache['misses']} промахов "
+        f"({cache['size']} в памяти)\n"
+        f"🔊 Кэш TTS: {tts['hit_rate']:.0%} попаданий "
+        f"({tts['memory_hits']} RAM / {tts['disk_hits']} диск / {tts['misses']} промахов), "
+        f"{tts['disk_bytes'] // 1024} КБ на диске\n\n"
+        f"🚦 Очереди:\n{queue_text}\n\n"
+        f"🧠 Промпт (токенов, последние {prompt['requests']}): "
+        f"средний {prompt['avg']}, макс {prompt['max']}\n"
+        f"💬 Кэш ответов: {replies['hit_rate']:.0%} попаданий ({replies['hits']} из "
+        f"{replies['hits'] + replies['misses']}), сэкономлено ≈"
+        f"{replies['prompt_tokens_saved'] + replies['completion_tokens_saved']} токенов\n"
+        f"🎙 Предобработка: {audio['notes']} голосовых, сэкономлено {saved // 1024} КБ "
+        f"({saved / audio['raw_bytes'] if audio['raw_bytes'] else 0:.0%}), "
+        f"срезано {audio['trimmed_ms'] // 1000} с тишины, ошибок {audio['failures']}\n"
+        f"⏱ Whisper в среднем: {stt_text}\n"
+        f"📤 Telegram: ждут отправки {sender['waiting']}, повторов после 429 {sender['retries']}, "
+        f"склеено правок {sender['coalesced']}\n"
+        f"📎 Аудио по file_id: {uploads['reused']} раз, сэкономлено {uploads['saved_bytes'] // 1024} КБ "
+        f"выгрузки (загружено {uploads['uploads']} файлов, {uploads['uploaded_bytes'] // 1024} КБ)\n"
+        f"🔀 LLM: основной {routes.get('primary_direct', 0)} (+{routes.get('primary_hedged', 0)} при хедже), "
+        f"запасной {routes.get('fallback_hedged', 0)}, порог хеджа {routes['hedge_delay']:.1f} с"
     )
 
     await message.answer(text)
@@ -268,66 +423,80 @@ async def handle_voice(message: Message, bot: Bot) -> None:
         await message.answer(t("error_not_configured", lang))
         return
 
-    processing_msg = await message.answer(t("processing", lang))
-
-    voice_file = None
-    tts_file = None
-
-    try:
-        file = await bot.get_file(message.voice.file_id)
-        voice_file = Path(tempfile.mktemp(suffix=".ogg"))
-        await bot.download_file(file.file_path, voice_file)
-
-        transcription = await transcribe_voice(voice_file)
-
-        if not transcription:
-            await processing_msg.edit_text(t("error_transcription", lang))
-            return
-
-        if user.script == "latin":
-            transcription = transliterate_to_latin(transcription)
-
-        safe_transcription = transcription.replace("_", "\\_").replace("*", "\\*")
-        await processing_msg.edit_text(
-            t("transcription", lang, text=safe_transcription),
-            parse_mode="Markdown",
-        )
+    if message.voice.duration > VOICE_MAX_DURATION:
+        await message.answer(t("voice_too_long", lang, limit=str(VOICE_MAX_DURATION)))
+        return
 
-        tutor_reply = await get_tutor_response(
-            transcription, user.dialect, user.script, user.ui_language, user.style,
-        )
+    priority = _priority(user)
+    processing_msg = await message.answer(_processing_text(stt_limiter, priority, lang))
 
-        await message.answer(tutor_reply)
-        await log_voice_message(message.from_user.id)
+    voice_audio = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MAX_BYTES)
+    speech = SpeechPipeline(priority)
 
-        try:
-            tts_file = await synthesize_speech(tutor_reply)
-            audio_input = FSInputFile(tts_file, filename="srpski_tutor.mp3")
-            await message.answer_document(audio_input)
-        except Exception:
-            logger.exception("Error synthesizing/sending audio")
+    # Steps that don't depend on each other run as tasks in one TaskGroup: history
+    # loads during download/STT, the transcription edit goes out while the LLM is
+    # already streaming, and the memory write overlaps TTS and the audio upload.
+    # Side steps go through _isolated, so only the main path can fail the reply;
+    # if it does, the TaskGroup cancels whatever is still running.
+    try:
+        async with user_jobs.hold(user.telegram_id), asyncio.TaskGroup() as tg:
+            history = tg.create_task(memory.history(user.telegram_id))
+
+            # A forwarded or re-sent note we have already transcribed needs neither download nor STT
+            transcription = get_cached_transcription(message.voice.file_unique_id, user.script)
+            if transcription is None:
+                with span("telegram_download"):
+                    await bot.download(message.voice, destination=voice_audio)
+
+                upload, preprocessed = await preprocess_voice(voice_audio)
+                transcription = ""
+                if upload is not None:
+                    transcription = await transcribe_voice(
+                        upload, filename="voice.ogg", priority=priority, preprocessed=preprocessed,
+                    )
+                if transcription:
+                    transcription = normalize_script(transcription, user.script)
+                    cache_transcription(message.voice.file_unique_id, user.script, transcription)
+
+            if not transcription:
+                await processing_msg.edit_text(t("error_transcription", lang))
+                return
+
+            safe_transcription = transcription.replace("_", "\\_").replace("*", "\\*")
+            tg.create_task(_isolated("Transcription edit", processing_msg.edit_text(
+                t("transcription", lang, text=safe_transcription),
+                parse_mode="Markdown",
+            )))
+
+            tutor_reply = await _stream_reply(message, speech.tap(stream_tutor_response(
+                transcription, user.dialect, user.script, user.ui_language, user.style,
+                conversation_history=await history, priority=priority,
+            )), user.script)
+
+            log_voice_message(message.from_user.id)
+            tg.create_task(_isolated("Conversation memory update",
+                                     memory.record(user.telegram_id, transcription, tutor_reply)))
+            tg.create_task(_isolated("Speech reply", _send_speech(message, speech)))
 
     except Exception:
         logger.exception("Error processing voice message")
         await message.answer(t("error_general", lang))
     finally:
-        if voice_file and voice_file.exists():
-            os.unlink(voice_file)
-        if tts_file and tts_file.exists():
-            os.unlink(tts_file)
+        speech.cancel()
+        voice_audio.close()
 
 
 # --- Text Messages ---
 
 
 @router.message(F.text)
-async def handle_text(message: Message, bot: Bot) -> None:
+async def handle_text(message: Message, bot: Bot, state: FSMContext, raw_state: str | None) -> None:
     user = await get_or_create_user(message.from_user.id)
     lang = user.ui_language
 
     # Forward message to admin if user is in support mode
-    if message.from_user.id in _support_mode:
-        _support_mode.discard(message.from_user.id)
+    if raw_state == SupportForm.waiting_message.state:
+        await state.clear()
         user_info = f"@{message.from_user.username}" if message.from_user.username else f"ID {message.from_user.id}"
         fwd_text = f"📩 Сообщение в поддержку от {user_info}:\n\n{message.text}"
         try:
@@ -359,27 +528,26 @@ async def handle_text(message: Message, bot: Bot) -> None:
         await message.answer(t("error_not_configured", lang))
         return
 
-    processing_msg = await message.answer(t("processing", lang))
+    priority = _priority(user)
+    processing_msg = await message.answer(_processing_text(chat_limiter, priority, lang))
 
-    tts_file = None
+    speech = SpeechPipeline(priority)
 
+    # Same orchestration as handle_voice: the memory write overlaps TTS and upload
     try:
-        tutor_reply = await get_tutor_response(
-            message.text, user.dialect, user.script, user.ui_language, user.style,
-        )
-
-        await processing_msg.edit_text(tutor_reply)
+        async with user_jobs.hold(user.telegram_id), asyncio.TaskGroup() as tg:
+            history = await memory.history(user.telegram_id)
+            tutor_reply = await _stream_reply(message, speech.tap(stream_tutor_response(
+                message.text, user.dialect, user.script, user.ui_language, user.style,
+                conversation_history=history, priority=priority,
+            )), user.script, target=processing_msg)
 
-        try:
-            tts_file = await synthesize_speech(tutor_reply)
-            audio_input = FSInputFile(tts_file, filename="srpski_tutor.mp3")
-            await message.answer_document(audio_input)
-        except Exception:
-            logger.exception("Error synthesizing/sending audio")
+            tg.create_task(_isolated("Conversation memory update",
+                                     memory.record(user.telegram_id, message.text, tutor_reply)))
+            tg.create_task(_isolated("Speech reply", _send_speech(message, speech)))
 
     except Exception:
         logger.exception("Error processing text message")
         await message.answer(t("error_general", lang))
     finally:
-        if tts_file and tts_file.exists():
-            os.unlink(tts_file)
+        speech.cancel()
@@ -166,6 +166,11 @@ TEXTS: dict[str, dict[str, str]] = {
         "en": "⏳ Processing your message...",
         "de": "⏳ Deine Nachricht wird verarbeitet...",
     },
+    "queue_position": {
+        "ru": "⏳ Сейчас много запросов. Вы в очереди: {position}. Скоро отвечу!",
+        "en": "⏳ Lots of requests right now. Your place in line: {position}. I'll reply soon!",
+        "de": "⏳ Gerade sind viele Anfragen da. Dein Platz in der Warteschlange: {position}. Ich antworte gleich!",
+    },
     "transcription": {
         "ru": "🎤 *Распознанный текст:*\n_{text}_",
         "en": "🎤 *Transcribed text:*\n_{text}_",
@@ -181,6 +186,11 @@ TEXTS: dict[str, dict[str, str]] = {
         "en": "Please send a voice message.",
         "de": "Bitte sende eine Sprachnachricht.",
     },
+    "voice_too_long": {
+        "ru": "Голосовое слишком длинное. Пожалуйста, уложитесь в {limit} секунд.",
+        "en": "This voice message is too long. Please keep it under {limit} seconds.",
+        "de": "Diese Sprachnachricht ist zu lang. Bitte bleib unter {limit} Sekunden.",
+    },
     "error_transcription": {
         "ru": "Не удалось распознать речь. Попробуйте записать сообщение ещё раз.",
         "en": "Could not transcribe speech. Please try recording again.",
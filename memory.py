@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+from cache import TTLCache
+from config import MEMORY_CACHE_TTL, MEMORY_CACHE_USERS, MEMORY_MAX_TURNS, MEMORY_TOKEN_BUDGET
+from database import (
+    append_conversation_turns, clear_conversation, compact_conversation, load_conversation,
+)
+from services import estimate_tokens, summarize_conversation
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Conversation:
+    summary: str = ""
+    # (db id, role, content), oldest first
+    turns: deque[tuple[int, str, str]] = field(default_factory=lambda: deque(maxlen=MEMORY_MAX_TURNS))
+
+    def tokens(self) -> int:
+        return sum(estimate_tokens(content) for _, _, content in self.turns)
+
+
+class ConversationMemory:
+    """Per-user dialogue history: an in-memory ring buffer in front of the DB tables.
+
+    History sent to the LLM is kept under `token_budget`. Once it grows past that,
+    the oldest turns are folded into a rolling summary in the background (until
+    about half the budget is left), so the prompt size stays flat however long
+    the learner chats.
+    """
+
+    def __init__(self, token_budget: int, max_users: int, ttl: float) -> None:
+        self.token_budget = token_budget
+        self._conversations: TTLCache[int, _Conversation] = TTLCache(max_users, ttl)
+        # Running compactions by user, kept here rather than on the cached conversation
+        # so a cache miss (or a disabled cache) never starts a second one
+        self._compacting: dict[int, asyncio.Task] = {}
+
+    async def _get(self, telegram_id: int) -> _Conversation:
+        conv = self._conversations.get(telegram_id)
+        if conv is None:
+            summary, turns = await load_conversation(telegram_id, MEMORY_MAX_TURNS)
+            conv = _Conversation(summary=summary)
+            conv.turns.extend(turns)
+            self._conversations.set(telegram_id, conv)
+        return conv
+
+    async def history(self, telegram_id: int) -> list[dict[str, str]]:
+        """Messages to place between the system prompt and the new user message."""
+        conv = await self._get(telegram_id)
+        messages = []
+        if conv.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation with this student:\n{conv.summary}",
+            })
+        # Oldest turns that are over budget (compaction still pending) are left out
+        budget = self.token_budget
+        recent: list[dict[str, str]] = []
+        for _, role, content in reversed(conv.turns):
+            budget -= estimate_tokens(content)
+            if budget < 0:
+                break
+            recent.append({"role": role, "content": content})
+        messages.extend(reversed(recent))
+        return messages
+
+    async def record(self, telegram_id: int, user_text: str, reply: str) -> None:
+        """Append one exchange and schedule compaction if history is over budget."""
+        conv = await self._get(telegram_id)
+        turns = [("user", user_text), ("assistant", reply)]
+        ids = await append_conversation_turns(telegram_id, turns)
+        conv.turns.extend((turn_id, role, content) for turn_id, (role, content) in zip(ids, turns))
+
+        if conv.tokens() > self.token_budget and telegram_id not in self._compacting:
+            task = asyncio.create_task(self._compact(telegram_id, conv))
+            self._compacting[telegram_id] = task
+            task.add_done_callback(lambda _: self._compacting.pop(telegram_id, None))
+
+    async def _compact(self, telegram_id: int, conv: _Conversation) -> None:
+        try:
+            # Another replica may have recorded or compacted turns since this copy was
+            # loaded; start from the DB so nothing is dropped or summarized twice
+            conv.summary, turns = await load_conversation(telegram_id, MEMORY_MAX_TURNS)
+            # ...keeping turns recorded here after that query ran
+            newest = turns[-1][0] if turns else 0
+            turns += [turn for turn in conv.turns if turn[0] > newest]
+            conv.turns.clear()
+            conv.turns.extend(turns)
+
+            folded: list[tuple[int, str, str]] = []
+            remaining = conv.tokens()
+            for turn in list(conv.turns):
+                if remaining <= self.token_budget // 2:
+                    break
+                folded.append(turn)
+                remaining -= estimate_tokens(turn[2])
+            if not folded:
+                return
+
+            summary = await summarize_conversation(
+                conv.summary, [{"role": role, "content": content} for _, role, content in folded],
+            )
+            folded_ids = {turn_id for turn_id, _, _ in folded}
+            if not await compact_conversation(telegram_id, summary, list(folded_ids), conv.summary):
+                # Another replica compacted meanwhile; reload its result on next use
+                logger.info("Conversation of %s was compacted elsewhere, discarding this summary", telegram_id)
+                self._conversations.pop(telegram_id)
+                return
+
+            conv.summary = summary
+            # Turns recorded while the summary was being written stay
+            kept = [turn for turn in conv.turns if turn[0] not in folded_ids]
+            conv.turns.clear()
+            conv.turns.extend(kept)
+            logger.info(
+                "Compacted %d turns for %s, history now ~%d tokens",
+                len(folded), telegram_id, conv.tokens(),
+            )
+        except Exception:
+            logger.exception("Conversation compaction failed for %s", telegram_id)
+
+    async def clear(self, telegram_id: int) -> None:
+        self._conversations.pop(telegram_id)
+        await clear_conversation(telegram_id)
+
+
+memory = ConversationMemory(MEMORY_TOKEN_BUDGET, MEMORY_CACHE_USERS, MEMORY_CACHE_TTL)
@@ -0,0 +1,194 @@
+"""Minimal Prometheus metrics: counters, gauges, histograms and timing spans.
+
+Everything registers itself in REGISTRY; `render()` produces the text exposition
+format served at /metrics. Counters and gauges can be backed by a callback, which is how
+existing in-process stats (cache hit counters, queue depths) are exported.
+"""
+from __future__ import annotations
+
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+REGISTRY: list["_Metric"] = []
+
+# Seconds; spans range from sub-millisecond cache hits to multi-second LLM replies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], le: str | None = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class _Value(_Metric):
+    """A single number per label set, either set directly or read from `fn` at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        fn: Callable[[], dict[tuple[str, ...], float]] | None = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._fn = fn
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        values = self._fn() if self._fn else self._values
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Counter(_Value):
+    kind = "counter"
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # per label set: [count per bucket..., +Inf count], sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def totals(self, **labels: str) -> tuple[int, float]:
+        """(count, sum) over every label set matching the given labels."""
+        wanted = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        count, total = 0, 0.0
+        for key, counts in self._counts.items():
+            if all(key[i] == value for i, value in wanted):
+                count += sum(counts)
+                total += self._sums[key]
+        return count, total
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, str(bound))} {cumulative}"
+            cumulative += counts[-1]
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, '+Inf')} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+STAGE_SECONDS = Histogram(
+    "tutor_stage_duration_seconds",
+    "Duration of each processing stage (Telegram I/O, STT, LLM, TTS, DB, whole handlers).",
+    ("stage", "model", "outcome"),
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "tutor_llm_prompt_tokens",
+    "Prompt tokens of each chat request, as reported by the provider.",
+    ("model",),
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000),
+)
+STAGE_IN_FLIGHT = Gauge(
+    "tutor_stage_in_flight",
+    "Spans currently running per stage.",
+    ("stage",),
+)
+
+
+@contextmanager
+def span(stage: str, model: str = "") -> Iterator[None]:
+    """Time a block into STAGE_SECONDS, labeled ok/error, and track it as in flight."""
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, model=model, outcome=outcome)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+def traced(stage: str, model: str = "") -> Callable:
+    """Decorator form of `span` for coroutine functions."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(stage, model):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class HandlerTimer(BaseMiddleware):
+    """Router middleware timing every handler call as stage `handler.<function name>`."""
+
+    async def __call__(self, handler, event, data):
+        with span(f"handler.{data['handler'].callback.__name__}"):
+            return await handler(event, data)
+
+
+def render() -> str:
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
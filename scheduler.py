@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+# Lower value is served first; FIFO within the same priority
+PRIORITY_PRO = 0
+PRIORITY_FREE = 1
+PRIORITY_BACKGROUND = 2
+
+
+class PriorityLimiter:
+    """Concurrency cap for one kind of provider call, with a priority wait queue.
+
+    At most `limit` holders run at once. When full, callers wait in a heap ordered
+    by (priority, arrival) and a released slot is handed straight to the next waiter.
+    """
+
+    def __init__(self, name: str, limit: int) -> None:
+        self.name = name
+        self.limit = limit
+        self._running = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._seq = itertools.count()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_FREE) -> AsyncIterator[None]:
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: int) -> None:
+        if self._running < self.limit and not self.waiting:
+            self._running += 1
+            return
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we were cancelled: pass it on
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._running -= 1
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def waiting_ahead(self, priority: int) -> int:
+        """How many queued callers a new caller with `priority` would wait behind."""
+        return sum(1 for p, _, fut in self._waiters if p <= priority and not fut.done())
+
+    def stats(self) -> dict[str, int]:
+        return {"running": self._running, "waiting": self.waiting, "limit": self.limit}
+
+
+class UserLocks:
+    """Per-user mutexes so each user has at most one job in flight; others queue in order."""
+
+    def __init__(self) -> None:
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._holders: dict[int, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, user_id: int) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._holders[user_id] = self._holders.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._holders[user_id] -= 1
+            if not self._holders[user_id]:
+                del self._holders[user_id]
+                del self._locks[user_id]
+
+    def __len__(self) -> int:
+        return len(self._holders)
@@ -0,0 +1,267 @@
+"""Flood control for outbound Telegram requests.
+
+Registered as a session middleware, so every call that targets a chat
+(message.answer, edit_text, answer_document, bot.send_message, ...) goes
+through it without changes at the call sites:
+
+- a token bucket per chat and a global one keep us under Telegram's limits;
+- a 429 pauses the chat's bucket for `retry_after` and the request is retried;
+- an edit_text for a message that already has an edit waiting for its turn
+  replaces that edit instead of queueing behind it (both callers get the result);
+- at most `max_pending` requests wait at once; further callers block until a
+  slot frees up, which pushes back on the handlers producing them.
+
+`send_document_once` avoids re-uploading files: Telegram's file_id for content
+it has already received is stored by content hash and sent instead of the bytes.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import EditMessageText, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import BufferedInputFile, Message
+
+import metrics
+from cache import TTLCache
+from config import (
+    TELEGRAM_CHAT_BURST, TELEGRAM_CHAT_RATE, TELEGRAM_GLOBAL_RATE, TELEGRAM_MAX_PENDING,
+    TELEGRAM_MAX_RETRIES, WORKERS,
+)
+from database import forget_telegram_file_id, get_telegram_file_id, save_telegram_file_id
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking.
+
+    `reserve()` takes a token immediately and returns how long the caller has to
+    wait before using it. The balance may go negative, which lines callers up in
+    arrival order without a lock.
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next `seconds` (after a 429)."""
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+@dataclass
+class _PendingEdit:
+    method: EditMessageText
+    future: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+    waiters: int = 0
+
+
+class FloodControl(BaseRequestMiddleware):
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_pending: int,
+        max_retries: int,
+    ) -> None:
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        # Every use refreshes the expiry, so only idle chats are evicted; their bucket
+        # just starts over full, which it would have reached anyway
+        self._chats: TTLCache[int | str, TokenBucket] = TTLCache(10000, 600)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._edits: dict[tuple[int | str, int], _PendingEdit] = {}
+        self.waiting = 0
+        self.retries = 0
+        self.coalesced = 0
+
+    def stats(self) -> dict[str, int]:
+        return {"waiting": self.waiting, "retries": self.retries, "coalesced": self.coalesced}
+
+    def _bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chats.set(chat_id, bucket)
+        return bucket
+
+    async def _wait_turn(self, chat_id: int | str) -> None:
+        start = time.perf_counter()
+        # Take the global token only once the chat's turn has come, so slow
+        # chats don't hold global capacity while they wait
+        delay = self._bucket(chat_id).reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        delay = self._global.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage="telegram_throttle",
+                                      model="", outcome="ok")
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        chat_id: int | str,
+        turn_taken: bool = False,
+    ) -> Response[TelegramType]:
+        for attempt in range(self.max_retries + 1):
+            if not turn_taken:
+                await self._wait_turn(chat_id)
+            turn_taken = False
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning("Flood control: %s to chat %s, retrying in %ss",
+                               method.__api_method__, chat_id, e.retry_after)
+                self._bucket(chat_id).pause(e.retry_after)
+        raise AssertionError("unreachable")
+
+    async def _send_edit(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: EditMessageText,
+        chat_id: int | str,
+    ) -> Response[TelegramType]:
+        key = (chat_id, method.message_id)
+        pending = self._edits.get(key)
+        if pending is not None:
+            # Still waiting for its turn: send this text instead and share the result
+            pending.method = method
+            pending.waiters += 1
+            self.coalesced += 1
+            return await asyncio.shield(pending.future)
+
+        pending = _PendingEdit(method)
+        self._edits[key] = pending
+        try:
+            await self._wait_turn(chat_id)
+            # Edits arriving from now on queue behind this one rather than replacing it
+            del self._edits[key]
+            result = await self._send(make_request, bot, pending.method, chat_id, turn_taken=True)
+        except BaseException as e:
+            if self._edits.get(key) is pending:
+                del self._edits[key]
+            if pending.waiters:
+                if isinstance(e, asyncio.CancelledError):
+                    pending.future.cancel()
+                else:
+                    pending.future.set_exception(e)
+            raise
+        pending.future.set_result(result)
+        return result
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getFile, getMe, webhook setup, callback answers: not rate limited per chat
+            return await make_request(bot, method)
+
+        self.waiting += 1
+        try:
+            async with self._slots:
+                if isinstance(method, EditMessageText) and method.message_id is not None:
+                    return await self._send_edit(make_request, bot, method, chat_id)
+                return await self._send(make_request, bot, method, chat_id)
+        finally:
+            self.waiting -= 1
+
+
+# In supervisor mode every worker process gets an equal share of the global limit;
+# per-chat buckets need no split since a chat's updates all go to one worker
+flood_control = FloodControl(
+    TELEGRAM_GLOBAL_RATE / WORKERS, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_MAX_PENDING,
+    TELEGRAM_MAX_RETRIES,
+)
+
+
+def get_sender_stats() -> dict[str, int]:
+    """Outbound Telegram requests waiting, 429 retries and coalesced edits."""
+    return flood_control.stats()
+
+
+metrics.Gauge("tutor_telegram_waiting", "Outbound Telegram requests waiting for a send slot or token.",
+              fn=lambda: {(): flood_control.waiting})
+metrics.Counter("tutor_telegram_events_total", "Flood control events.", ("event",),
+                fn=lambda: {("retry_after",): flood_control.retries, ("coalesced_edit",): flood_control.coalesced})
+
+
+# --- Uploaded file reuse ---
+
+_uploads = {
+    "uploads": 0,
+    "uploaded_bytes": 0,
+    "reused": 0,
+    "saved_bytes": 0,
+    "stale": 0,
+}
+
+
+def get_upload_stats() -> dict[str, int]:
+    """Documents uploaded vs sent by file_id, with the bytes each way."""
+    return dict(_uploads)
+
+
+metrics.Counter("tutor_telegram_document_bytes_total", "Document bytes uploaded vs sent as a stored file_id.",
+                ("kind",), fn=lambda: {("uploaded",): _uploads["uploaded_bytes"], ("saved",): _uploads["saved_bytes"]})
+
+
+async def send_document_once(message: Message, data: bytes, filename: str) -> Message:
+    """Reply with `data` as a document, by file_id if the same bytes were uploaded before."""
+    content_hash = hashlib.sha256(data).hexdigest()
+    file_id = await get_telegram_file_id(content_hash)
+    if file_id is not None:
+        try:
+            with metrics.span("telegram_send_file_id"):
+                sent = await message.answer_document(file_id)
+        except TelegramBadRequest as e:
+            # Unknown to this bot (e.g. after a token change): upload the bytes again
+            _uploads["stale"] += 1
+            logger.info("Stored file_id rejected, uploading again: %s", e)
+            await forget_telegram_file_id(content_hash)
+        else:
+            _uploads["reused"] += 1
+            _uploads["saved_bytes"] += len(data)
+            return sent
+
+    with metrics.span("telegram_upload"):
+        sent = await message.answer_document(BufferedInputFile(data, filename=filename))
+    _uploads["uploads"] += 1
+    _uploads["uploaded_bytes"] += len(data)
+    if sent.document is not None:
+        await save_telegram_file_id(content_hash, sent.document.file_id)
+    return sent
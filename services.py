@@ -1,241 +1,523 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-import tempfile
-from pathlib import Path
+import re
+import time
+import unicodedata
+from collections import deque
+from typing import AsyncIterator, BinaryIO, NamedTuple
 
 from openai import AsyncOpenAI
 
+from audio_cache import AudioCache, audio_key
+from cache import TTLCache
 from config import (
-    LLM_API_KEY, LLM_BASE_URL, OPENAI_API_KEY,
-    WHISPER_MODEL, CHAT_MODEL, TTS_MODEL, TTS_VOICE,
+    LLM_API_KEY, LLM_BASE_URL, OPENAI_API_KEY, OPENAI_BASE_URL,
+    WHISPER_MODEL, CHAT_MODEL, TTS_MODEL, TTS_VOICE, TTS_MIN_CHUNK_CHARS,
+    TTS_CACHE_DIR, TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES,
+    STT_CONCURRENCY, CHAT_CONCURRENCY, TTS_CONCURRENCY, SUMMARY_MODEL,
+    LLM_FIRST_TOKEN_TIMEOUT, LLM_STALL_TIMEOUT, LLM_TOTAL_TIMEOUT,
+    LLM_FALLBACK_MODEL, LLM_FALLBACK_BASE_URL, LLM_FALLBACK_API_KEY,
+    LLM_HEDGE_DELAY, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_DELAY, LLM_STREAM_USAGE,
+    TRANSCRIPTION_CACHE_SIZE, TRANSCRIPTION_CACHE_TTL,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DISABLED_STYLES,
 )
+from metrics import LLM_PROMPT_TOKENS, STAGE_SECONDS, Counter, Gauge, span
+from prompts import get_system_prompt
+from scheduler import PRIORITY_BACKGROUND, PRIORITY_FREE, PriorityLimiter, UserLocks
 
 logger = logging.getLogger(__name__)
 
-# Serbian Cyrillic ↔ Latin transliteration (1:1 mapping)
-_CYR_TO_LAT = {
-    "А": "A", "Б": "B", "В": "V", "Г": "G", "Д": "D", "Ђ": "Đ",
-    "Е": "E", "Ж": "Ž", "З": "Z", "И": "I", "Ј": "J", "К": "K",
-    "Л": "L", "Љ": "Lj", "М": "M", "Н": "N", "Њ": "Nj", "О": "O",
-    "П": "P", "Р": "R", "С": "S", "Т": "T", "Ћ": "Ć", "У": "U",
-    "Ф": "F", "Х": "H", "Ц": "C", "Ч": "Č", "Џ": "Dž", "Ш": "Š",
-    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "ђ": "đ",
-    "е": "e", "ж": "ž", "з": "z", "и": "i", "ј": "j", "к": "k",
-    "л": "l", "љ": "lj", "м": "m", "н": "n", "њ": "nj", "о": "o",
-    "п": "p", "р": "r", "с": "s", "т": "t", "ћ": "ć", "у": "u",
-    "ф": "f", "х": "h", "ц": "c", "ч": "č", "џ": "dž", "ш": "š",
-}
-
-
-def transliterate_to_latin(text: str) -> str:
-    """Transliterate Serbian Cyrillic text to Latin script."""
-    result = []
-    for ch in text:
-        result.append(_CYR_TO_LAT.get(ch, ch))
-    return "".join(result)
-
-# RouteLLM/Abacus — for chat completions
-llm_client = AsyncOpenAI(api_key=LLM_API_KEY, base_url=LLM_BASE_URL)
+# The OpenAI SDK's default number of retries on 429s, 5xx and connection errors
+LLM_MAX_RETRIES = 2
+
+# RouteLLM/Abacus — for chat completions. Deadlines are enforced by _hedged_stream and it
+# fails over to the fallback route when there is one; without it, the SDK retries instead.
+llm_client = AsyncOpenAI(
+    api_key=LLM_API_KEY, base_url=LLM_BASE_URL, timeout=LLM_TOTAL_TIMEOUT,
+    max_retries=0 if LLM_FALLBACK_MODEL else LLM_MAX_RETRIES,
+)
+
+# Secondary route for hedged chat requests
+fallback_llm_client = AsyncOpenAI(
+    api_key=LLM_FALLBACK_API_KEY, base_url=LLM_FALLBACK_BASE_URL, timeout=LLM_TOTAL_TIMEOUT, max_retries=0,
+)
 
 # OpenAI direct — for Whisper (STT) and TTS
-audio_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-
-SYSTEM_PROMPT_TEMPLATE = """You are a patient and encouraging Serbian language tutor.
-
-The student is learning Serbian and has chosen the **{dialect_name}** dialect.
-The student wants you to write in **{script_name}** script.
-
-{dialect_instructions}
-
-{script_instructions}
-
-The student's native language is **{explanation_language}**. ALL explanations, translations, and corrections MUST be written in {explanation_language}. NEVER mix languages in explanations.
-
-Rules:
-- Your main conversational response: ALWAYS in Serbian (chosen dialect and script).
-- Keep your responses conversational and natural — as if you are chatting with a friend who is learning the language.
-- Encourage the student and praise their effort.
-- If you provide translations or explanations inline, put them in parentheses in {explanation_language}.
-- After your main response in Serbian, add a section called "---\\n📝 {corrections_header}" (Corrections).
-  In this section, explain any grammar, vocabulary, or pronunciation mistakes the student made.
-  Write ALL corrections and explanations ONLY in {explanation_language}. Do NOT use any other language for explanations.
-  ALL Serbian words quoted in the corrections section MUST use the chosen script ({script_name}). Never quote Serbian words in a different script.
-  If there are no mistakes, write "{no_mistakes_text}"
-- If the transcribed text seems garbled or nonsensical (Whisper errors), try to guess what the student meant and respond accordingly, noting what you think they meant.
-"""
-
-DIALECT_EKAVICA = """You speak **Ekavica** (standard Serbian, Belgrade dialect).
-Use Ekavica forms: "lepo" (not "lijepo"), "devojka" (not "djevojka"), "reka" (not "rijeka"), "mleko" (not "mlijeko"), "dete" (not "dijete").
-Sound like a friendly Belgrader — casual, warm, urban.
-"""
-
-DIALECT_IJEKAVICA = """You speak **Ijekavica** — specifically the Montenegrin variant.
-You are a local from Budva or Podgorica. Use authentic Montenegrin forms:
-- "lijepo" (not "lepo"), "djevojka" (not "devojka"), "rijeka" (not "reka"), "mlijeko" (not "mleko"), "dijete" (not "dete")
-- Use Montenegrin-specific words: "đe" (gdje/where), "ođe" (ovdje/here), "niđe" (nigdje/nowhere), "sjutra" (sutra/tomorrow)
-- Use "nijesam" instead of "nisam"
-- Sound natural, warm, and laid-back — like a real Montenegrin
-- Slang expressions like "more", "ala", "vala" — use ONLY if the communication style is casual/kafana
-"""
-
-
-SCRIPT_CYRILLIC = """CRITICAL: Write ALL Serbian text in **Cyrillic** script (Ћирилица).
-Example: "Добар дан! Како сте? Ја сам ваш наставник."
-NEVER use Latin letters (a-z) for Serbian words. Always use Cyrillic (а-я, ђ, ж, љ, њ, ћ, ч, ш, џ).
-"""
-
-SCRIPT_LATIN = """CRITICAL: Write ALL Serbian text in **Latin** script (Latinica) — EVERYWHERE in your response.
-Example: "Dobar dan! Kako ste? Ja sam vaš nastavnik."
-Example Ijekavica: "Đe si, more? Lijepo je danas. Hajdemo na kafu."
-NEVER use Cyrillic letters (а-я) for Serbian words. Always use Latin (a-z, č, ć, đ, š, ž, lj, nj, dž).
-This applies to ALL parts of your response:
-- Main conversational text: Latin only
-- Quoted Serbian words in corrections: Latin only (e.g. "dobro veče" NOT "добро вече")
-- Examples and suggestions: Latin only
-The student is learning to READ Latin script. Every single Serbian word MUST be in Latin letters, with ZERO exceptions.
-"""
-
-
-STYLE_FORMAL = """Communication style: **Formal / Literary**.
-Speak in proper, grammatically perfect Serbian. Use full sentences, polite forms (Vi/Ви), literary vocabulary.
-Sound like a university professor or a news anchor.
-IMPORTANT: Do NOT use slang, colloquialisms, or dialect-specific informal expressions (no "more", "ala", "vala", "bre", "ba", "ajde" etc.).
-"""
-
-STYLE_EVERYDAY = """Communication style: **Everyday / Conversational**.
-Speak naturally, as people do in everyday situations — at the shop, with a plumber, at a café ordering coffee.
-Use informal "ti" (ти), normal conversational sentences, common vocabulary.
-Friendly and warm, but not slangy. No heavy dialect expressions, no kafana slang.
-IMPORTANT: Do NOT use informal filler expressions like "more", "ala", "vala", "bre", "ba" etc.
-"""
-
-STYLE_CASUAL = """Communication style: **Casual / Kafana talk**.
-Speak like you're sitting in a kafana (кафана) with a friend over rakija.
-Use informal "ti" (ти), slang, colloquial expressions, humor, and casual shortcuts.
-Use filler words like "bre" (бре), "ba" (ба), "ma" (ма), "ajde" (ајде), "more" (море), "vala" (вала).
-Be relaxed, funny, warm — like a real buddy helping out.
-"""
-
-STYLE_BEGINNER = """Communication style: **Simple / Beginner-friendly**.
-The student is a COMPLETE BEGINNER. Use VERY simple language:
-- Short sentences (5-8 words max)
-- Basic vocabulary only (A1-A2 level)
-- Repeat key words for reinforcement
-- Always provide translation of your Serbian words in parentheses
-- Speak slowly and clearly, as if to a child learning their first words
-- Use lots of encouragement
-IMPORTANT: Do NOT use slang or informal dialect expressions (no "more", "ala", "vala", "bre" etc.).
-"""
-
-
-def _build_system_prompt(dialect: str, script: str = "cyrillic", ui_language: str = "ru", style: str = "casual") -> str:
-    dialect_name = "Ijekavica (Montenegrin)" if dialect == "ijekavica" else "Ekavica (Standard Serbian)"
-    dialect_instr = DIALECT_IJEKAVICA if dialect == "ijekavica" else DIALECT_EKAVICA
-    script_name = "Latin (Latinica)" if script == "latin" else "Cyrillic (Ћирилица)"
-    script_instr = SCRIPT_LATIN if script == "latin" else SCRIPT_CYRILLIC
-    explanation_lang = {"ru": "Russian", "en": "English", "de": "German"}.get(ui_language, "English")
-
-    style_map = {"formal": STYLE_FORMAL, "everyday": STYLE_EVERYDAY, "casual": STYLE_CASUAL, "beginner": STYLE_BEGINNER}
-    style_instr = style_map.get(style, STYLE_EVERYDAY)
-
-    if script == "latin":
-        corrections_header = "Ispravke"
-        no_mistakes_text = "Odlično! Nema grešaka. / Отлично! Ошибок нет."
-    else:
-        corrections_header = "Исправке"
-        no_mistakes_text = "Одлично! Нема грешака. / Отлично! Ошибок нет."
-
-    return SYSTEM_PROMPT_TEMPLATE.format(
-        dialect_name=dialect_name,
-        dialect_instructions=dialect_instr,
-        script_name=script_name,
-        script_instructions=script_instr,
-        explanation_language=explanation_lang,
-        corrections_header=corrections_header,
-        no_mistakes_text=no_mistakes_text,
-    ) + "\n" + style_instr
-
-
-async def transcribe_voice(file_path: str | Path) -> str:
-    """Transcribe voice audio using OpenAI Whisper."""
-    logger.info("Transcribing voice: %s", file_path)
-    with open(file_path, "rb") as audio_file:
-        response = await audio_client.audio.transcriptions.create(
-            model=WHISPER_MODEL,
-            file=audio_file,
-            language="sr",
-        )
+audio_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+# Backpressure: separate caps per provider call type, Pro users served first when
+# queued, and at most one in-flight job per user (taken by the handlers).
+stt_limiter = PriorityLimiter("stt", STT_CONCURRENCY)
+chat_limiter = PriorityLimiter("chat", CHAT_CONCURRENCY)
+tts_limiter = PriorityLimiter("tts", TTS_CONCURRENCY)
+user_jobs = UserLocks()
+
+
+def get_queue_stats() -> dict[str, dict[str, int]]:
+    """Running/waiting counts per provider call type, plus users with a job in flight."""
+    stats = {lim.name: lim.stats() for lim in (stt_limiter, chat_limiter, tts_limiter)}
+    stats["users"] = {"running": len(user_jobs)}
+    return stats
+
+
+def _queue_gauge(field: str) -> dict[tuple[str, ...], float]:
+    return {(lim.name,): lim.stats()[field] for lim in (stt_limiter, chat_limiter, tts_limiter)}
+
+
+Gauge("tutor_provider_running", "Provider calls holding a concurrency slot.", ("queue",),
+      fn=lambda: _queue_gauge("running"))
+Gauge("tutor_provider_waiting", "Provider calls queued for a concurrency slot.", ("queue",),
+      fn=lambda: _queue_gauge("waiting"))
+Gauge("tutor_user_jobs", "Users with a voice/text job in flight.",
+      fn=lambda: {(): len(user_jobs)})
+
+
+async def transcribe_voice(
+    audio: BinaryIO, filename: str = "voice.ogg", priority: int = PRIORITY_FREE,
+    preprocessed: bool = False,
+) -> str:
+    """Transcribe voice audio using OpenAI Whisper.
+
+    `audio` is any readable binary buffer; `filename` tells Whisper the container format.
+    Preprocessed uploads are timed as a separate stage so the two can be compared.
+    """
+    logger.info("Transcribing voice: %s", filename)
+    async with stt_limiter.slot(priority):
+        with span("stt_preprocessed" if preprocessed else "stt", WHISPER_MODEL):
+            response = await audio_client.audio.transcriptions.create(
+                model=WHISPER_MODEL,
+                file=(filename, audio),
+                language="sr",
+            )
     text = response.text.strip()
     logger.info("Transcription result: %s", text)
     return text
 
 
-async def get_tutor_response(
+# (file_unique_id, WHISPER_MODEL, script) -> transcription already normalized to that script.
+# file_unique_id is the same for every copy of a file, including forwards from other users.
+_transcription_cache: TTLCache[tuple[str, str, str], str] = TTLCache(
+    TRANSCRIPTION_CACHE_SIZE, TRANSCRIPTION_CACHE_TTL,
+)
+
+Counter("tutor_transcription_cache_lookups_total", "Transcription cache lookups by result.", ("result",),
+        fn=lambda: {("hit",): _transcription_cache.hits, ("miss",): _transcription_cache.misses})
+
+
+def get_cached_transcription(file_unique_id: str, script: str) -> str | None:
+    return _transcription_cache.get((file_unique_id, WHISPER_MODEL, script))
+
+
+def cache_transcription(file_unique_id: str, script: str, text: str) -> None:
+    _transcription_cache.set((file_unique_id, WHISPER_MODEL, script), text)
+
+
+def get_transcription_cache_stats() -> dict[str, int]:
+    """Hit/miss counters of the transcription cache."""
+    return _transcription_cache.stats()
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token plus per-message overhead)."""
+    return len(text) // 4 + 4
+
+
+# Prompt size of recent chat requests as reported by the provider, to confirm it stays
+# flat over long sessions (also exported as LLM_PROMPT_TOKENS)
+_prompt_tokens: deque[int] = deque(maxlen=500)
+
+
+def get_prompt_token_stats() -> dict[str, int]:
+    """Average and max prompt tokens over the recent chat requests."""
+    if not _prompt_tokens:
+        return {"requests": 0, "avg": 0, "max": 0}
+    return {
+        "requests": len(_prompt_tokens),
+        "avg": sum(_prompt_tokens) // len(_prompt_tokens),
+        "max": max(_prompt_tokens),
+    }
+
+
+def _build_messages(
     user_text: str,
     dialect: str,
-    script: str = "cyrillic",
-    ui_language: str = "ru",
-    style: str = "casual",
-    conversation_history: list[dict[str, str]] | None = None,
-) -> str:
-    """Get tutor response from LLM via RouteLLM/Abacus API."""
-    system_prompt = _build_system_prompt(dialect, script, ui_language, style)
+    script: str,
+    ui_language: str,
+    style: str,
+    conversation_history: list[dict[str, str]] | None,
+) -> list[dict[str, str]]:
+    prompt = get_system_prompt(dialect, script, ui_language, style)
+    logger.debug("Using system prompt %s", prompt.id)
 
-    messages: list[dict[str, str]] = [{"role": "system", "content": system_prompt}]
+    messages: list[dict[str, str]] = [{"role": "system", "content": prompt.text}]
 
     if conversation_history:
         messages.extend(conversation_history)
 
     messages.append({"role": "user", "content": user_text})
+    return messages
+
+
+class _Route(NamedTuple):
+    name: str
+    client: AsyncOpenAI
+    model: str
+
+
+_PRIMARY = _Route("primary", llm_client, CHAT_MODEL)
+_FALLBACK = _Route("fallback", fallback_llm_client, LLM_FALLBACK_MODEL) if LLM_FALLBACK_MODEL else None
+
+# Recent primary-route times to first token; their p95 is when a request gets hedged
+_first_token_times: deque[float] = deque(maxlen=200)
+
+# (route, "hedged" | "direct") -> chat requests that route answered first
+_route_wins: dict[tuple[str, str], int] = {}
+
+Counter("tutor_llm_route_wins_total", "Chat requests by the route that answered first.", ("route", "mode"),
+        fn=lambda: dict(_route_wins))
 
-    logger.info("Requesting tutor response for: %s (dialect: %s)", user_text, dialect)
-    response = await llm_client.chat.completions.create(
-        model=CHAT_MODEL,
+
+def get_llm_route_stats() -> dict[str, int | float]:
+    """Wins per route (hedged or not) and the current hedge threshold."""
+    wins = {f"{route}_{mode}": count for (route, mode), count in _route_wins.items()}
+    return {"hedge_delay": hedge_delay(), **wins}
+
+
+def hedge_delay() -> float:
+    """Seconds to wait for the primary's first token before also asking the fallback."""
+    if len(_first_token_times) < 20:
+        return LLM_HEDGE_DELAY
+    ordered = sorted(_first_token_times)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return min(max(p95, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+
+async def _route_stream(
+    route: _Route, messages: list[dict[str, str]], temperature: float, max_tokens: int,
+) -> AsyncIterator[str]:
+    stream = await route.client.chat.completions.create(
+        model=route.model,
         messages=messages,
-        temperature=0.7,
-        max_tokens=1500,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        **({"stream_options": {"include_usage": True}} if LLM_STREAM_USAGE else {}),
     )
-
-    reply = response.choices[0].message.content or ""
-    logger.info("Tutor response length: %d chars", len(reply))
+    try:
+        async for chunk in stream:
+            # With include_usage the last chunk carries the usage and no choices
+            if chunk.usage is not None:
+                _prompt_tokens.append(chunk.usage.prompt_tokens)
+                LLM_PROMPT_TOKENS.observe(chunk.usage.prompt_tokens, model=route.model)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        await stream.close()
+
+
+async def _hedged_stream(
+    messages: list[dict[str, str]], temperature: float, max_tokens: int,
+) -> AsyncIterator[str]:
+    """Stream a chat completion with per-attempt deadlines and a hedged second route.
+
+    The primary gets hedge_delay() seconds to produce its first token (or fails
+    sooner); then the fallback route is started too. Whichever yields a token
+    first is streamed to the caller and the other is cancelled. Raises
+    TimeoutError if no route starts within LLM_FIRST_TOKEN_TIMEOUT, or if the
+    winner stalls for LLM_STALL_TIMEOUT or runs past LLM_TOTAL_TIMEOUT.
+    """
+    started = time.perf_counter()
+    attempts: dict[asyncio.Task[str], tuple[_Route, AsyncIterator[str]]] = {}
+
+    def launch(route: _Route) -> None:
+        gen = _route_stream(route, messages, temperature, max_tokens)
+        attempts[asyncio.create_task(anext(gen))] = (route, gen)
+
+    launch(_PRIMARY)
+    hedge_at = started + hedge_delay() if _FALLBACK else None
+    first_token_deadline = started + LLM_FIRST_TOKEN_TIMEOUT
+    last_error: BaseException | None = None
+    winner = None
+    try:
+        while winner is None:
+            # Hedge once the primary is slower than usual, or right away if it failed
+            if hedge_at is not None and (not attempts or time.perf_counter() >= hedge_at):
+                logger.info("Starting fallback LLM route after %.1fs", time.perf_counter() - started)
+                hedge_at = None
+                launch(_FALLBACK)
+            if not attempts:
+                raise last_error or RuntimeError("LLM returned an empty response")
+            wake_at = min(hedge_at, first_token_deadline) if hedge_at else first_token_deadline
+            done, _ = await asyncio.wait(
+                attempts, timeout=max(0.0, wake_at - time.perf_counter()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done and time.perf_counter() >= first_token_deadline:
+                raise TimeoutError(f"No LLM tokens within {LLM_FIRST_TOKEN_TIMEOUT}s")
+            for task in done:
+                route, gen = attempts.pop(task)
+                try:
+                    winner = (route, gen, task.result())
+                    break
+                except StopAsyncIteration:
+                    last_error = RuntimeError(f"{route.name} LLM route returned an empty response")
+                except Exception as e:
+                    last_error = e
+                    logger.warning("%s LLM route failed: %r", route.name, e)
+    finally:
+        for task in attempts:
+            task.cancel()
+        await asyncio.gather(*attempts, return_exceptions=True)
+        for _, gen in attempts.values():
+            await gen.aclose()
+
+    route, gen, delta = winner
+    first_token = time.perf_counter() - started
+    hedged = _FALLBACK is not None and hedge_at is None
+    # If the fallback won, the primary took at least this long, so it still counts as a sample
+    _first_token_times.append(first_token)
+    key = (route.name, "hedged" if hedged else "direct")
+    _route_wins[key] = _route_wins.get(key, 0) + 1
+    STAGE_SECONDS.observe(first_token, stage="llm_first_token", model=route.model, outcome="ok")
+
+    total_deadline = started + LLM_TOTAL_TIMEOUT
+    try:
+        while True:
+            yield delta
+            remaining = total_deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"LLM reply exceeded {LLM_TOTAL_TIMEOUT}s")
+            try:
+                delta = await asyncio.wait_for(anext(gen), min(LLM_STALL_TIMEOUT, remaining))
+            except StopAsyncIteration:
+                break
+    finally:
+        await gen.aclose()
+
+
+# (text, dialect, script, ui_language, style, CHAT_MODEL) -> (reply, estimated prompt tokens).
+# Only first messages are cached: with history the same text calls for a different reply.
+_response_cache: TTLCache[tuple[str, ...], tuple[str, int]] = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+_response_tokens_saved = {"prompt": 0, "completion": 0}
+
+Counter("tutor_response_cache_lookups_total", "Tutor reply cache lookups by result.", ("result",),
+        fn=lambda: {("hit",): _response_cache.hits, ("miss",): _response_cache.misses})
+Counter("tutor_response_cache_tokens_saved_total", "Estimated LLM tokens not sent thanks to cached replies.",
+        ("kind",), fn=lambda: {(kind,): tokens for kind, tokens in _response_tokens_saved.items()})
+
+
+def _response_cache_key(
+    user_text: str, dialect: str, script: str, ui_language: str, style: str,
+    conversation_history: list[dict[str, str]] | None,
+) -> tuple[str, ...] | None:
+    """Cache key for this request, or None when it must not be cached."""
+    if conversation_history or style in RESPONSE_CACHE_DISABLED_STYLES:
+        return None
+    return (_normalize_text(user_text), dialect, script, ui_language, style, CHAT_MODEL)
+
+
+def _cached_response(key: tuple[str, ...] | None) -> str | None:
+    if key is None:
+        return None
+    cached = _response_cache.get(key)
+    if cached is None:
+        return None
+    reply, prompt_tokens = cached
+    _response_tokens_saved["prompt"] += prompt_tokens
+    _response_tokens_saved["completion"] += estimate_tokens(reply)
     return reply
 
 
-def _extract_serbian_part(text: str) -> str:
-    """Extract only the Serbian part of the response (before corrections section)."""
-    # Look for corrections header — must be "📝" marker, not a generic "---"
-    separators = [
-        "\n---\n📝",
-        "\n---\n\n📝",
-        "📝 Ispravke",
-        "📝 Исправке",
-        "📝 Corrections",
-    ]
-    result = text
-    for sep in separators:
-        if sep in result:
-            result = result.split(sep)[0]
-            break
-    return result.strip()
-
-
-async def synthesize_speech(text: str) -> Path:
-    """Synthesize speech using OpenAI TTS. Returns path to the audio file."""
-    serbian_text = _extract_serbian_part(text)
-    logger.info("Synthesizing speech for: %s...", serbian_text[:80])
-
-    response = await audio_client.audio.speech.create(
-        model=TTS_MODEL,
-        voice=TTS_VOICE,
-        input=serbian_text,
-        response_format="mp3",
-        speed=0.9,
-    )
+def get_response_cache_stats() -> dict[str, int | float]:
+    """Hit rate of the tutor reply cache and the estimated tokens it saved."""
+    stats = _response_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+        "prompt_tokens_saved": _response_tokens_saved["prompt"],
+        "completion_tokens_saved": _response_tokens_saved["completion"],
+    }
 
-    tmp = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
-    tmp.write(response.content)
-    tmp.close()
 
-    logger.info("Speech synthesized: %s", tmp.name)
-    return Path(tmp.name)
+async def stream_tutor_response(
+    user_text: str,
+    dialect: str,
+    script: str = "cyrillic",
+    ui_language: str = "ru",
+    style: str = "casual",
+    conversation_history: list[dict[str, str]] | None = None,
+    priority: int = PRIORITY_FREE,
+) -> AsyncIterator[str]:
+    """Stream tutor response from LLM, yielding text deltas as they arrive.
+
+    A cached reply is yielded as a single delta.
+    """
+    cache_key = _response_cache_key(user_text, dialect, script, ui_language, style, conversation_history)
+    cached = _cached_response(cache_key)
+    if cached is not None:
+        logger.info("Tutor response cache hit: %s", user_text[:40])
+        yield cached
+        return
+    messages = _build_messages(user_text, dialect, script, ui_language, style, conversation_history)
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+
+    logger.info("Streaming tutor response for: %s (dialect: %s)", user_text, dialect)
+    parts: list[str] = []
+    async with chat_limiter.slot(priority):
+        with span("llm", CHAT_MODEL):
+            async for delta in _hedged_stream(messages, 0.7, 1500):
+                parts.append(delta)
+                yield delta
+    reply = "".join(parts)
+    logger.info("Tutor response length: %d chars (streamed)", len(reply))
+    # Only complete replies get here; an abandoned or failed stream is never cached
+    if cache_key is not None and reply:
+        _response_cache.set(cache_key, (reply, prompt_tokens))
+
+
+TTS_SPEED = 0.9
+
+# Start of the corrections section; nothing after it is spoken
+_CORRECTIONS_MARKER = "📝"
+
+# Whitespace after sentence-final punctuation (optionally followed by closing quotes/brackets)
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"»”)]*\s+")
+
+
+SUMMARY_PROMPT = """You maintain a running summary of a Serbian tutoring conversation.
+Merge the previous summary and the new dialogue turns into one updated summary.
+Keep: topics discussed, the student's level, recurring mistakes, vocabulary introduced, personal details the student shared.
+Write at most 120 words, in English, as plain prose."""
+
+
+async def summarize_conversation(previous_summary: str, turns: list[dict[str, str]]) -> str:
+    """Fold dialogue turns into the rolling conversation summary (background priority)."""
+    dialogue = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    async with chat_limiter.slot(PRIORITY_BACKGROUND):
+        with span("llm_summary", SUMMARY_MODEL):
+            # Never hedged, so this call always retries
+            response = await llm_client.with_options(max_retries=LLM_MAX_RETRIES).chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": f"Previous summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{dialogue}"},
+                ],
+                temperature=0.2,
+                max_tokens=300,
+            )
+    return (response.choices[0].message.content or "").strip()
+
+
+tts_cache = AudioCache(TTS_CACHE_DIR or None, TTS_CACHE_MEMORY_BYTES, TTS_CACHE_DISK_BYTES)
+
+Counter("tutor_tts_cache_lookups_total", "TTS cache lookups by result.", ("result",),
+        fn=lambda: {(result,): tts_cache.stats()[name] for result, name in (
+            ("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))})
+Gauge("tutor_tts_cache_bytes", "Bytes held by each TTS cache tier.", ("tier",),
+      fn=lambda: {("memory",): tts_cache.stats()["memory_bytes"], ("disk",): tts_cache.stats()["disk_bytes"]})
+
+
+def _normalize_text(text: str) -> str:
+    """Canonical form of text for cache keys (TTS input, tutor prompts): NFC, collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def get_tts_cache_stats() -> dict[str, int | float]:
+    """Hit/miss counters and sizes of the TTS audio cache."""
+    return tts_cache.stats()
+
+
+async def _synthesize_bytes(text: str, priority: int = PRIORITY_FREE) -> bytes:
+    """Return MP3 bytes for `text`, from the TTS cache or a fresh OpenAI TTS request."""
+    key = audio_key(TTS_MODEL, TTS_VOICE, str(TTS_SPEED), _normalize_text(text))
+    cached = await tts_cache.get(key)
+    if cached is not None:
+        logger.info("TTS cache hit: %s...", text[:40])
+        return cached
+
+    async with tts_limiter.slot(priority):
+        with span("tts", TTS_MODEL):
+            response = await audio_client.audio.speech.create(
+                model=TTS_MODEL,
+                voice=TTS_VOICE,
+                input=text,
+                response_format="mp3",
+                speed=TTS_SPEED,
+            )
+    await tts_cache.put(key, response.content)
+    return response.content
+
+
+class SpeechPipeline:
+    """Synthesizes the Serbian part of a streamed reply sentence by sentence.
+
+    Every delta from the LLM goes through `tap()`; as soon as enough complete
+    sentences have accumulated they are sent to TTS, so synthesis overlaps with
+    generation. Everything after the corrections marker is ignored. `finish()`
+    joins the clips in reply order.
+    """
+
+    def __init__(self, priority: int = PRIORITY_FREE) -> None:
+        self._priority = priority
+        self._buffer = ""
+        self._closed = False
+        self._tasks: list[asyncio.Task[bytes]] = []
+
+    async def tap(self, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass LLM deltas through unchanged while feeding them to the pipeline."""
+        async for delta in chunks:
+            self.feed(delta)
+            yield delta
+
+    def feed(self, delta: str) -> None:
+        if self._closed:
+            return
+        self._buffer += delta
+        marker = self._buffer.find(_CORRECTIONS_MARKER)
+        if marker != -1:
+            self._buffer = self._buffer[:marker].rstrip().rstrip("-")
+            self._flush_all()
+            return
+
+        boundaries = list(_SENTENCE_END.finditer(self._buffer))
+        if not boundaries:
+            return
+        cut = boundaries[-1].end()
+        if len(self._buffer[:cut].strip()) >= TTS_MIN_CHUNK_CHARS:
+            self._submit(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+
+    def _flush_all(self) -> None:
+        self._closed = True
+        self._submit(self._buffer)
+        self._buffer = ""
+
+    def _submit(self, text: str) -> None:
+        text = text.strip()
+        # Skip fragments like a lone "---" separator before the corrections header
+        if not any(ch.isalnum() for ch in text):
+            return
+        logger.info("Synthesizing sentence chunk %d: %s...", len(self._tasks) + 1, text[:80])
+        self._tasks.append(asyncio.create_task(_synthesize_bytes(text, self._priority)))
+
+    async def finish(self) -> bytes | None:
+        """Synthesize whatever is left and return the joined MP3 bytes, or None if empty."""
+        if not self._closed:
+            self._flush_all()
+        if not self._tasks:
+            return None
+        clips = await asyncio.gather(*self._tasks)
+        audio = b"".join(clips)
+        logger.info("Speech synthesized from %d chunks: %d bytes", len(clips), len(audio))
+        return audio
+
+    def cancel(self) -> None:
+        """Cancel TTS requests that are still in flight."""
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,238 @@
+"""Supervisor mode: spread updates over several worker processes, sharded by user.
+
+The supervisor only receives updates (long polling or webhook), reads the
+sender's id out of the raw JSON and puts the update on that shard's queue. Each
+worker process runs its own Bot and Dispatcher, so parsing, ORM work and audio
+preprocessing use as many cores as there are workers. A user always lands on
+the same shard, so their updates are handled in order by one process, and the
+per-process caches and locks keep working unchanged.
+
+Workers are restarted one at a time on SIGHUP and whenever one dies; a worker
+that is being replaced finishes its in-flight updates first while new ones wait
+in its queue for the replacement.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from queue import Empty
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Put on a shard's queue to make its worker drain and exit
+_STOP = None
+
+# Event fields that identify who an update comes from, in order of preference
+_SENDER_FIELDS = ("from", "user", "voter_chat", "chat")
+
+
+def shard_key(update: dict[str, Any]) -> int:
+    """The sender's id (from_user.id in aiogram terms), else the chat's, else the update id."""
+    for name, event in update.items():
+        if not isinstance(event, dict):
+            continue
+        for field in _SENDER_FIELDS:
+            sender = event.get(field)
+            if isinstance(sender, dict) and "id" in sender:
+                return int(sender["id"])
+    return int(update.get("update_id", 0))
+
+
+class _Shard:
+    def __init__(self, index: int, queue: Queue) -> None:
+        self.index = index
+        self.queue = queue
+        self.process: BaseProcess | None = None
+        self.updates = 0
+        self.restarts = 0
+        self.replacing = False
+
+
+class Supervisor:
+    """Starts `workers` processes running `target(index, queue)` and routes updates to them."""
+
+    def __init__(self, target: Callable[[int, Queue], None], workers: int, shutdown_timeout: float) -> None:
+        self._ctx = multiprocessing.get_context("spawn")
+        self._target = target
+        self._shutdown_timeout = shutdown_timeout
+        self._shards = [_Shard(i, self._ctx.Queue()) for i in range(workers)]
+        self._watcher: asyncio.Task | None = None
+        self._stopping = False
+
+    def _spawn(self, shard: _Shard) -> None:
+        shard.process = self._ctx.Process(
+            target=self._target, args=(shard.index, shard.queue), name=f"worker-{shard.index}", daemon=False,
+        )
+        shard.process.start()
+        logger.info("Worker %d started (pid %s)", shard.index, shard.process.pid)
+
+    def start(self) -> None:
+        for shard in self._shards:
+            self._spawn(shard)
+        self._watcher = asyncio.create_task(self._watch())
+
+    def dispatch(self, update: dict[str, Any]) -> None:
+        shard = self._shards[shard_key(update) % len(self._shards)]
+        shard.updates += 1
+        shard.queue.put(update)
+
+    async def _stop_worker(self, shard: _Shard) -> None:
+        """Ask the worker to drain and exit; kill it if it takes longer than the timeout."""
+        process = shard.process
+        if process is None or not process.is_alive():
+            return
+        shard.queue.put(_STOP)
+        await asyncio.to_thread(process.join, self._shutdown_timeout)
+        if process.is_alive():
+            logger.warning("Worker %d did not stop within %ss, terminating", shard.index, self._shutdown_timeout)
+            process.terminate()
+            await asyncio.to_thread(process.join, 5)
+
+    async def restart(self) -> None:
+        """Rolling restart: replace one worker at a time, the others keep serving."""
+        for shard in self._shards:
+            if self._stopping:
+                return
+            shard.replacing = True
+            try:
+                await self._stop_worker(shard)
+                if not self._stopping:
+                    shard.restarts += 1
+                    self._spawn(shard)
+            finally:
+                shard.replacing = False
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(1)
+            for shard in self._shards:
+                if shard.replacing or shard.process is None or shard.process.is_alive():
+                    continue
+                logger.error("Worker %d exited with code %s, restarting", shard.index, shard.process.exitcode)
+                shard.restarts += 1
+                self._spawn(shard)
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+        await asyncio.gather(*(self._stop_worker(shard) for shard in self._shards))
+        for shard in self._shards:
+            shard.queue.close()
+        logger.info("All workers stopped")
+
+    def stats(self) -> list[dict[str, int | bool]]:
+        return [
+            {
+                "shard": shard.index,
+                "up": shard.process is not None and shard.process.is_alive(),
+                "updates": shard.updates,
+                "restarts": shard.restarts,
+                "queued": shard.queue.qsize(),
+            }
+            for shard in self._shards
+        ]
+
+    def register_metrics(self) -> None:
+        def _by_shard(field: str) -> Callable[[], dict[tuple[str, ...], float]]:
+            return lambda: {(str(s["shard"]),): float(s[field]) for s in self.stats()}
+
+        metrics.Counter("tutor_shard_updates_total", "Updates routed to each worker.", ("shard",),
+                        fn=_by_shard("updates"))
+        metrics.Counter("tutor_shard_restarts_total", "Worker restarts (rolling or after a crash).", ("shard",),
+                        fn=_by_shard("restarts"))
+        metrics.Gauge("tutor_shard_queue_depth", "Updates waiting for each worker.", ("shard",),
+                      fn=_by_shard("queued"))
+        metrics.Gauge("tutor_shard_up", "Whether each worker process is running.", ("shard",),
+                      fn=_by_shard("up"))
+
+
+async def consume(queue: Queue, handle: Callable[[dict[str, Any]], Awaitable[Any]]) -> None:
+    """Worker side: run `handle` as a task per update until told to stop, then wait for them.
+
+    Different users are handled concurrently; one user's updates run one after
+    another in arrival order, each task waiting for that user's previous one.
+    Also returns if the supervisor goes away without saying so.
+    """
+    parent = multiprocessing.parent_process()
+    tasks: set[asyncio.Task] = set()
+    # Latest task per sender, for the next update of theirs to wait on
+    tails: dict[int, asyncio.Task] = {}
+
+    def _get() -> Any:
+        while True:
+            try:
+                return queue.get(timeout=1)
+            except Empty:
+                if parent is not None and not parent.is_alive():
+                    return _STOP
+
+    async def _handle(update: dict[str, Any], previous: asyncio.Task | None) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await handle(update)
+        except Exception:
+            logger.exception("Failed to process update %s", update.get("update_id"))
+
+    def _done(key: int, task: asyncio.Task) -> None:
+        tasks.discard(task)
+        if tails.get(key) is task:
+            del tails[key]
+
+    while (update := await asyncio.to_thread(_get)) is not _STOP:
+        key = shard_key(update)
+        task = asyncio.create_task(_handle(update, tails.get(key)))
+        tails[key] = task
+        tasks.add(task)
+        task.add_done_callback(functools.partial(_done, key))
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def poll_updates(
+    api_url: str,
+    allowed_updates: list[str],
+    dispatch: Callable[[dict[str, Any]], None],
+    stop: asyncio.Event,
+    timeout: int = 30,
+) -> None:
+    """Long-poll getUpdates at `api_url` and hand each raw update to `dispatch`.
+
+    Updates are never parsed into aiogram objects here; that happens in the workers.
+    """
+    offset = 0
+    backoff = 1.0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout + 10)) as session:
+        while not stop.is_set():
+            payload = {"offset": offset, "timeout": timeout, "allowed_updates": allowed_updates}
+            request = asyncio.ensure_future(session.post(api_url, json=payload))
+            stopped = asyncio.create_task(stop.wait())
+            await asyncio.wait({request, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
+            if not request.done():
+                request.cancel()
+                break
+            try:
+                async with request.result() as resp:
+                    body = await resp.json()
+                if not body.get("ok"):
+                    raise RuntimeError(body.get("description", "getUpdates failed"))
+            except Exception as e:
+                logger.warning("getUpdates failed: %s, retrying in %.0fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 1.0
+            for update in body["result"]:
+                offset = update["update_id"] + 1
+                dispatch(update)
@@ -0,0 +1,279 @@
+"""Key-value store for conversation state shared between bot replicas.
+
+StateStore has three backends, picked by STATE_STORE:
+- "memory": a dict in this process (single instance, lost on restart);
+- "database": the state_store table in the bot's own database;
+- "redis": any server speaking RESP (Redis, Valkey, KeyDB, ...), via a
+  minimal built-in client so no extra dependency is needed.
+
+Every value can carry a TTL, and `get_many` fetches several keys in one round
+trip. `StateStoreStorage` adapts a store to aiogram's FSM storage interface.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from typing import Any
+from urllib.parse import unquote, urlsplit
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import REDIS_URL, STATE_STORE, STATE_TTL
+from database import purge_expired_state, state_delete, state_get_many, state_set
+
+
+class StateStore(ABC):
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Values of the given keys; missing and expired keys are left out."""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        """Store `value`, expiring after `ttl` seconds if given."""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        pass
+
+    async def get(self, key: str) -> str | None:
+        return (await self.get_many([key])).get(key)
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryStateStore(StateStore):
+    # Expired keys are dropped when read, and in bulk every this many writes
+    _PURGE_EVERY = 1000
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[str, float | None]] = {}
+        self._writes = 0
+
+    def _live(self, key: str, now: float) -> str | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return None
+        return value
+
+    async def get_many(self, keys: list[str]) -> dict[str, str]:
+        now = time.monotonic()
+        values = {key: self._live(key, now) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        now = time.monotonic()
+        self._data[key] = (value, now + ttl if ttl else None)
+        self._writes += 1
+        if self._writes % self._PURGE_EVERY == 0:
+            for stale in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[stale]
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class DatabaseStateStore(StateStore):
+    _PURGE_EVERY = 1000
+
+    def __init__(self) -> None:
+        self._writes = 0
+
+    async def get_many(self, keys: list[str]) -> dict[str, str]:
+        if not keys:
+            return {}
+        return await state_get_many(keys)
+
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl) if ttl else None
+        await state_set(key, value, expires_at)
+        self._writes += 1
+        if self._writes % self._PURGE_EVERY == 0:
+            await purge_expired_state()
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await state_delete(list(keys))
+
+
+class RedisError(Exception):
+    """Error reply from the server."""
+
+
+def _encode(args: tuple[str | bytes | int, ...]) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def _read_reply(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length == -1:
+            return None
+        return (await reader.readexactly(length + 2))[:-2].decode()
+    if kind == b"*":
+        length = int(body)
+        if length == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply: {line!r}")
+
+
+class RedisStateStore(StateStore):
+    """RESP2 client over one connection: redis://[:password@]host[:port][/db].
+
+    Commands are serialized on the connection, which is plenty for FSM traffic
+    (a couple of small commands per update). A connection that fails or is
+    cancelled mid-command is closed, since an unread reply would otherwise be
+    taken as the answer to the next command, and reopened on the next one.
+    """
+
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self._host = parts.hostname or "localhost"
+        self._port = parts.port or 6379
+        self._password = unquote(parts.password) if parts.password else None
+        self._username = unquote(parts.username) if parts.username else None
+        self._db = int(parts.path.lstrip("/") or 0)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+            try:
+                if self._password:
+                    auth = (self._username, self._password) if self._username else (self._password,)
+                    await self._roundtrip("AUTH", *auth)
+                if self._db:
+                    await self._roundtrip("SELECT", self._db)
+            except BaseException:
+                # Even on an error reply: never reuse a connection left unauthenticated or on db 0
+                self._abort()
+                raise
+        return self._reader, self._writer
+
+    async def _roundtrip(self, *args: str | int) -> Any:
+        self._writer.write(_encode(args))
+        await self._writer.drain()
+        return await _read_reply(self._reader)
+
+    async def command(self, *args: str | int) -> Any:
+        async with self._lock:
+            try:
+                await self._connect()
+                return await self._roundtrip(*args)
+            except RedisError:
+                raise
+            except BaseException:
+                self._abort()
+                raise
+
+    def _abort(self) -> None:
+        """Drop the connection without waiting, safe to call while being cancelled."""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def get_many(self, keys: list[str]) -> dict[str, str]:
+        if not keys:
+            return {}
+        values = await self.command("MGET", *keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        if ttl:
+            await self.command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            await self.command("SET", key, value)
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.command("DEL", *keys)
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._disconnect()
+
+
+def create_state_store() -> StateStore:
+    """The store configured by STATE_STORE."""
+    if STATE_STORE == "redis":
+        return RedisStateStore(REDIS_URL)
+    if STATE_STORE == "database":
+        return DatabaseStateStore()
+    return MemoryStateStore()
+
+
+class StateStoreStorage(BaseStorage):
+    """aiogram FSM storage on top of a StateStore.
+
+    State and data live under separate keys with the same TTL, so a user who
+    abandons a flow (e.g. /support without a follow-up) is dropped out of it.
+    """
+
+    def __init__(self, store: StateStore, ttl: float | None = STATE_TTL, prefix: str = "fsm") -> None:
+        self.store = store
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, key: StorageKey, part: str) -> str:
+        fields = [
+            self.prefix, str(key.bot_id), str(key.chat_id), str(key.user_id),
+            str(key.thread_id or ""), key.business_connection_id or "", key.destiny, part,
+        ]
+        return ":".join(fields)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        if state is None:
+            await self.store.delete(self._key(key, "state"))
+        else:
+            await self.store.set(self._key(key, "state"), state, self.ttl)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self.store.get(self._key(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not data:
+            await self.store.delete(self._key(key, "data"))
+        else:
+            await self.store.set(self._key(key, "data"), json.dumps(dict(data)), self.ttl)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        raw = await self.store.get(self._key(key, "data"))
+        return json.loads(raw) if raw else {}
+
+    async def close(self) -> None:
+        await self.store.close()
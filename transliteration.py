@@ -0,0 +1,167 @@
+"""Serbian Cyrillic <-> Latin transliteration built on precompiled str.translate tables.
+
+Cyrillic -> Latin is a pure 1:1 letter mapping (three letters become digraphs).
+Latin -> Cyrillic also has to fold the digraphs lj/nj/dž back into single letters,
+except in the handful of words where those letters meet across a morpheme
+boundary (nad-živeti, kon-jugacija, ...), which are listed in _DIGRAPH_EXCEPTIONS.
+Replies often quote English, brand names or the student's Russian, so only words
+that are unambiguously Serbian are converted, in either direction (see normalize_script).
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+
+_CYR_TO_LAT = {
+    "А": "A", "Б": "B", "В": "V", "Г": "G", "Д": "D", "Ђ": "Đ",
+    "Е": "E", "Ж": "Ž", "З": "Z", "И": "I", "Ј": "J", "К": "K",
+    "Л": "L", "Љ": "Lj", "М": "M", "Н": "N", "Њ": "Nj", "О": "O",
+    "П": "P", "Р": "R", "С": "S", "Т": "T", "Ћ": "Ć", "У": "U",
+    "Ф": "F", "Х": "H", "Ц": "C", "Ч": "Č", "Џ": "Dž", "Ш": "Š",
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "ђ": "đ",
+    "е": "e", "ж": "ž", "з": "z", "и": "i", "ј": "j", "к": "k",
+    "л": "l", "љ": "lj", "м": "m", "н": "n", "њ": "nj", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "ћ": "ć", "у": "u",
+    "ф": "f", "х": "h", "ц": "c", "ч": "č", "џ": "dž", "ш": "š",
+}
+
+# Single Latin letters only; digraphs are handled before this table is applied
+_LAT_TO_CYR = {lat: cyr for cyr, lat in _CYR_TO_LAT.items() if len(lat) == 1}
+
+_DIGRAPHS = {
+    "lj": "љ", "Lj": "Љ", "LJ": "Љ", "lJ": "љ",
+    "nj": "њ", "Nj": "Њ", "NJ": "Њ", "nJ": "њ",
+    "dž": "џ", "Dž": "Џ", "DŽ": "Џ", "dŽ": "џ",
+}
+
+# Word starts where l+j, n+j or d+ž are two letters, not one (lowercase Latin)
+_DIGRAPH_EXCEPTIONS = (
+    "injek", "konjek", "konjug", "konjunk", "tanjug", "vanjezi", "vanjevrop",
+    "nadžanr", "nadživ", "nadžnj", "podžanr", "podžup", "odžal", "odživ",
+    "predželu", "predžet",
+)
+
+TO_LATIN = str.maketrans(_CYR_TO_LAT)
+TO_CYRILLIC = str.maketrans(_LAT_TO_CYR)
+
+_DIGRAPH_RE = re.compile("|".join(_DIGRAPHS))
+_EXCEPTION_RE = re.compile(
+    r"\b(?:" + "|".join(_DIGRAPH_EXCEPTIONS) + r")", re.IGNORECASE,
+)
+# "ЉУБАВ" must become "LJUBAV", not "LjUBAV"
+_CAPS_DIGRAPH_CYR_RE = re.compile(r"[ЉЊЏ][А-ШЂЈЉЊЋЏ]|[А-ШЂЈЉЊЋЏ][ЉЊЏ]")
+_CAPS_DIGRAPH_RE = re.compile(r"(Lj|Nj|Dž)(?=[A-ZČĆĐŠŽ])|(?<=[A-ZČĆĐŠŽ])(Lj|Nj|Dž)")
+
+# Letters that never occur in Serbian; words containing them are another language
+_NON_SERBIAN_CYRILLIC = set("ыэъьёйщяюЫЭЪЬЁЙЩЯЮ")
+_NON_SERBIAN_LATIN = set("qwxyäöüßQWXYÄÖÜ")
+# Letters only Serbian (of the languages students write in) uses; a word with one is Serbian
+_SERBIAN_LATIN = set("čćđšžČĆĐŠŽ")
+_SERBIAN_CYRILLIC = set("ђјљњћџЂЈЉЊЋЏ")
+# Spellings Serbian never produces: English digraphs, camelCase brand names, acronyms
+_FOREIGN_LATIN_RE = re.compile(r"(?i:th|ph|ch|ck|gh)|[a-z][A-Z]|^[A-Z]{2,}\W*$")
+
+# Without a Serbian letter, a word is only converted when its sentence has a Serbian
+# function word and no English (Latin) or Russian (Cyrillic) one. Lowercase "i" is
+# "and", "I" is English; the Cyrillic list leaves out words Russian shares (и, на, да, ...).
+_SERBIAN_WORDS = frozenset((
+    "i", "u", "je", "su", "sam", "si", "smo", "ste", "da", "se", "na", "za", "od", "do",
+    "ne", "li", "ali", "ili", "sa", "iz", "kod", "kao", "kako", "gde", "gdje", "kada",
+    "ja", "mi", "ti", "vi", "oni", "ovo", "ono", "koji", "koja", "koje", "bi", "dobro", "hvala",
+    "zdravo",
+))
+_ENGLISH_WORDS = frozenset((
+    "the", "and", "is", "are", "was", "you", "your", "my", "of", "with", "this", "that",
+    "it", "for", "what", "have", "be",
+))
+_SERBIAN_CYRILLIC_WORDS = frozenset((
+    "је", "су", "сам", "си", "смо", "сте", "се", "од", "са", "код", "као", "како", "али",
+    "ја", "ви", "ово", "оно", "који", "која", "које", "шта", "хвала", "здраво",
+))
+_RUSSIAN_WORDS = frozenset((
+    "что", "это", "как", "так", "когда", "все", "спасибо", "привет", "перевод",
+))
+
+_CORRECTIONS_MARKER = "📝"
+_PARENTHESIZED_RE = re.compile(r"(\([^)]*\))")
+# HTML tags are whole tokens, and a sentence never ends inside one
+_TAG_RE = re.compile(r"<[^>]*>")
+_TOKEN_RE = re.compile(r"<[^>]*>|[^\s<]+")
+_SENTENCE_RE = re.compile(r"(?:<[^>]*>|[^.!?\n])+[.!?\n]*|[.!?\n]+")
+# URLs, mentions, hashtags and HTML tags are never transliterated
+_VERBATIM_RE = re.compile(r"://|^www\.|^[@#<]")
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def to_latin(text: str) -> str:
+    """Transliterate Serbian Cyrillic text to Latin script."""
+    caps_digraphs = _CAPS_DIGRAPH_CYR_RE.search(text) is not None
+    text = text.translate(TO_LATIN)
+    if caps_digraphs:
+        text = _CAPS_DIGRAPH_RE.sub(lambda m: m.group().upper(), text)
+    return text
+
+
+def to_cyrillic(text: str) -> str:
+    """Transliterate Serbian Latin text to Cyrillic script."""
+    text = unicodedata.normalize("NFC", text)
+    text = _EXCEPTION_RE.sub(lambda m: m.group().translate(TO_CYRILLIC), text)
+    text = _DIGRAPH_RE.sub(lambda m: _DIGRAPHS[m.group()], text)
+    return text.translate(TO_CYRILLIC)
+
+
+def _serbian_sentence(sentence: str, script: str) -> bool:
+    """Whether the words `script` would convert read as Serbian in this sentence."""
+    serbian = False
+    for word in _WORD_RE.findall(_TAG_RE.sub(" ", sentence)):
+        lower = word.lower()
+        if script == "latin":
+            if _NON_SERBIAN_CYRILLIC.intersection(word) or lower in _RUSSIAN_WORDS:
+                return False
+            serbian = serbian or _SERBIAN_CYRILLIC.intersection(word) or lower in _SERBIAN_CYRILLIC_WORDS
+        else:
+            if word == "I" or lower in _ENGLISH_WORDS:
+                return False
+            serbian = serbian or _SERBIAN_LATIN.intersection(word) or lower in _SERBIAN_WORDS
+    return bool(serbian)
+
+
+def _convert_token(token: str, script: str, serbian_sentence: bool = True) -> str:
+    if _VERBATIM_RE.search(token):
+        return token
+    if script == "latin":
+        if _NON_SERBIAN_CYRILLIC.intersection(token):
+            return token
+        if not serbian_sentence and not _SERBIAN_CYRILLIC.intersection(token):
+            return token
+        return to_latin(token)
+    if _NON_SERBIAN_LATIN.intersection(token):
+        return token
+    if not _SERBIAN_LATIN.intersection(token) and (
+        not serbian_sentence or _FOREIGN_LATIN_RE.search(token)
+    ):
+        return token
+    return to_cyrillic(token)
+
+
+def _convert_sentence(sentence: str, script: str) -> str:
+    serbian = _serbian_sentence(sentence, script)
+    return _TOKEN_RE.sub(lambda m: _convert_token(m.group(), script, serbian), sentence)
+
+
+def normalize_script(text: str, script: str) -> str:
+    """Bring the Serbian part of a tutor reply into the user's chosen script.
+
+    Only text before the corrections marker is touched, and parenthesized
+    translations are left alone, since those are in the student's own language.
+    Words with letters that don't exist in Serbian are skipped for the same reason.
+    Words only change script when they are unambiguously Serbian: they have a
+    Serbian-only letter (č, ć, đ, š, ž or ђ, ј, љ, њ, ћ, џ), or their sentence reads
+    as Serbian and, for Latin words, they aren't spelled like English, a brand name
+    or an acronym.
+    """
+    head, marker, tail = text.partition(_CORRECTIONS_MARKER)
+    parts = _PARENTHESIZED_RE.split(head)
+    for i in range(0, len(parts), 2):
+        parts[i] = _SENTENCE_RE.sub(lambda m: _convert_sentence(m.group(), script), parts[i])
+    return "".join(parts) + marker + tail